@@ -22,11 +22,57 @@ from . import AutoBlindTools
 from . import AutoBlindEval
 from . import AutoBlindValue
 from . import AutoBlindDefaults
-import datetime
+from . import AutoBlindTimer
+from . import AutoBlindExecutor
+import threading
+from collections import OrderedDict
+
+# Number of item writes handled by write plans: planned, written, replaced by a later write to the same item
+# ("overwritten") or skipped because the change is lower than mindelta ("mindelta")
+_write_statistics = {"planned": 0, "written": 0, "overwritten": 0, "mindelta": 0}
+_write_statistics_lock = threading.Lock()
+
+
+# Items (and values to set) having a certain attribute, used by "as_byattr" actions. Key: name of attribute
+_byattr_items = {}
+# Incremented whenever the byattr items are reloaded, so actions know when to determine their items again
+_byattr_generation = 0
+
+
+# Return a copy of the write statistics
+def get_write_statistics():
+    with _write_statistics_lock:
+        return dict(_write_statistics)
+
+
+# Return items having an attribute together with the value of the attribute. Items are searched only once per
+# attribute until reload_byattr_items() is called
+# smarthome: Instance of smarthome.py-class
+# attribute: name of attribute
+# returns: tuple of tuples (item, value)
+def get_byattr_items(smarthome, attribute):
+    items = _byattr_items.get(attribute)
+    if items is None:
+        items = tuple((item, item.conf[attribute]) for item in smarthome.find_items(attribute))
+        _byattr_items[attribute] = items
+    return items
+
+
+# Search items for "as_byattr" actions again at their next execution (e.g. after items have been reloaded)
+def reload_byattr_items():
+    global _byattr_generation
+    _byattr_items.clear()
+    _byattr_generation += 1
 
 
 # Base class from which all action classes are derived
 class AbActionBase(AutoBlindTools.AbItemChild):
+    __slots__ = ("_name", "__delay", "__repeat", "__order", "_scheduler_name")
+    # Actions writing items via _plan/_write set this to True
+    _uses_write_plan = False
+    # Write plans do not replace the write of a forcing action by a later write of the same value
+    _forces_write = False
+
     # Cast function for delay
     # value: value to cast
     @staticmethod
@@ -67,9 +113,22 @@ class AbActionBase(AutoBlindTools.AbItemChild):
     def update_order(self, value):
         self.__order.set(value)
 
+    # Run the action asynchronously (only supported by "as_run" actions)
+    def update_async(self, value):
+        self._log_warning("Action '{0}': Parameter 'async' is only supported for 'run' actions. Ignoring.", self._name)
+
     def get_order(self):
         return self.__order.get(1)
 
+    # Check if the order is determined dynamically (item, eval, variable) and may change between executions
+    def has_dynamic_order(self):
+        return self.__order.get_type() not in (None, "value")
+
+    # Replace unused values by shared empty values (after completion)
+    def compact(self):
+        self.__delay = AutoBlindValue.AbValue.compact(self.__delay)
+        self.__order = AutoBlindValue.AbValue.compact(self.__order)
+
     # Write action to logger
     def write_to_logger(self):
         self.__delay.write_to_logger()
@@ -80,7 +139,8 @@ class AbActionBase(AutoBlindTools.AbItemChild):
     # Execute action (considering delay, etc)
     # is_repeat: Inidicate if this is a repeated action without changing the state
     # item_allow_repeat: Is repeating actions generally allowed for the item?
-    def execute(self, is_repeat: bool, allow_item_repeat: bool):
+    # write_plan: AbWritePlan-Instance collecting the immediate item writes of the update (None: write directly)
+    def execute(self, is_repeat: bool, allow_item_repeat: bool, write_plan=None):
         if not self._can_execute():
             return
 
@@ -99,16 +159,23 @@ class AbActionBase(AutoBlindTools.AbItemChild):
         else:
             repeat_text = ""
 
-        plan_next = self._sh.scheduler.return_next(self._scheduler_name)
-        if plan_next is not None and plan_next > self._sh.now():
+        # delay timers are unique per AbItem and target (item, logic, ...) of the action
+        timer_key = (self._abitem.id, self._scheduler_name)
+        if AutoBlindTimer.remove(timer_key):
             self._log_info("Action '{0}: Removing previous delay timer '{1}'.", self._name, self._scheduler_name)
-            self._sh.scheduler.remove(self._scheduler_name)
 
         delay = 0 if self.__delay.is_empty() else self.__delay.get()
         actionname = "Action '{0}'".format(self._name) if delay == 0 else "Delay Timer '{0}'".format(
             self._scheduler_name)
         if delay == 0:
-            self._execute(actionname, repeat_text)
+            if write_plan is None:
+                self._execute(actionname, repeat_text)
+            elif self._uses_write_plan:
+                self._plan(write_plan, actionname, repeat_text)
+            else:
+                # the action may depend on items written by previous actions
+                write_plan.flush()
+                self._execute(actionname, repeat_text)
         elif delay is None:
             self._log_warning("Action'{0}: Ignored because of errors while determining the delay!", self._name)
         elif delay < 0:
@@ -116,8 +183,7 @@ class AbActionBase(AutoBlindTools.AbItemChild):
         else:
             self._log_info("Action '{0}: Add {1} second timer '{2}' for delayed execution. {3}", self._name, delay,
                            self._scheduler_name, repeat_text)
-            next_run = self._sh.now() + datetime.timedelta(seconds=delay)
-            self._sh.scheduler.add(self._scheduler_name, self._execute, value={'actionname': actionname}, next=next_run)
+            AutoBlindTimer.add(timer_key, delay, self._execute, {'actionname': actionname})
 
     # set the action based on a set_(action_name) attribute
     # value: Value of the set_(action_name) attribute
@@ -137,9 +203,21 @@ class AbActionBase(AutoBlindTools.AbItemChild):
     def _execute(self, actionname: str, repeat_text: str = ""):
         raise NotImplementedError("Class %s doesn't implement _execute()" % self.__class__.__name__)
 
+    # Add the item write of the action to a write plan instead of executing it (only if _uses_write_plan is True)
+    def _plan(self, write_plan, actionname: str, repeat_text: str = ""):
+        raise NotImplementedError("Class %s doesn't implement _plan()" % self.__class__.__name__)
+
+    # Write value to item. Called by write plans (only if _uses_write_plan is True)
+    # returns: True = value has been written, False = value has not been written because of mindelta
+    def _write(self, value, actionname: str, repeat_text: str = ""):
+        raise NotImplementedError("Class %s doesn't implement _write()" % self.__class__.__name__)
+
 
 # Class representing a single "as_set" action
 class AbActionSetItem(AbActionBase):
+    __slots__ = ("__item", "__value", "__mindelta", "__caller")
+    _uses_write_plan = True
+
     # Initialize the action
     # abitem: parent AbItem instance
     # name: Name of action
@@ -176,6 +254,11 @@ class AbActionSetItem(AbActionBase):
             if self._abitem.id == self.__item.id():
                 self.__caller += '_self'
 
+    # Replace unused values by shared empty values (after completion)
+    def compact(self):
+        AbActionBase.compact(self)
+        self.__mindelta = AutoBlindValue.AbValue.compact(self.__mindelta)
+
     # Write action to logger
     def write_to_logger(self):
         AbActionBase.write_to_logger(self)
@@ -199,9 +282,18 @@ class AbActionSetItem(AbActionBase):
     # Really execute the action (needs to be implemented in derived classes)
     def _execute(self, actionname: str, repeat_text: str = ""):
         value = self.__value.get()
-        if value is None:
-            return
+        if value is not None:
+            self._write(value, actionname, repeat_text)
 
+    # Add the item write of the action to a write plan instead of executing it
+    def _plan(self, write_plan, actionname: str, repeat_text: str = ""):
+        value = self.__value.get()
+        if value is not None:
+            write_plan.add(self.__item, self, value, actionname, repeat_text)
+
+    # Write value to item
+    # returns: True = value has been written, False = value has not been written because of mindelta
+    def _write(self, value, actionname: str, repeat_text: str = ""):
         if not self.__mindelta.is_empty():
             mindelta = self.__mindelta.get()
             # noinspection PyCallingNonCallable
@@ -209,21 +301,26 @@ class AbActionSetItem(AbActionBase):
             if delta < mindelta:
                 text = "{0}: Not setting '{1}' to '{2}' because delta '{3:.2}' is lower than mindelta '{4}'"
                 self._log_debug(text, actionname, self.__item.id(), value, delta, mindelta)
-                return
+                return False
 
         self._log_debug("{0}: Set '{1}' to '{2}'.{3}", actionname, self.__item.id(), value, repeat_text)
         # noinspection PyCallingNonCallable
         self.__item(value, caller=self.__caller)
+        return True
 
 
 # Class representing a single "as_setbyattr" action
 class AbActionSetByattr(AbActionBase):
+    __slots__ = ("__byattr", "__items", "__generation")
+
     # Initialize the action
     # abitem: parent AbItem instance
     # name: Name of action
     def __init__(self, abitem, name: str):
         super().__init__(abitem, name)
         self.__byattr = None
+        self.__items = ()
+        self.__generation = None
 
     # set the action based on a set_(action_name) attribute
     # value: Value of the set_(action_name) attribute
@@ -234,6 +331,8 @@ class AbActionSetByattr(AbActionBase):
     # item_state: state item to read from
     def complete(self, item_state):
         self._scheduler_name = self.__byattr + "-AbByAttrDelayTimer"
+        self.__items = get_byattr_items(self._sh, self.__byattr)
+        self.__generation = _byattr_generation
 
     # Write action to logger
     def write_to_logger(self):
@@ -244,13 +343,40 @@ class AbActionSetByattr(AbActionBase):
     # Really execute the action
     def _execute(self, actionname: str, repeat_text: str = ""):
         self._log_info("{0}: Setting values by attribute '{1}'.{2}", actionname, self.__byattr, repeat_text)
-        for item in self._sh.find_items(self.__byattr):
-            self._log_info("\t{0} = {1}", item.id(), item.conf[self.__byattr])
-            item(item.conf[self.__byattr], caller=AutoBlindDefaults.plugin_identification)
+        if self.__generation != _byattr_generation:
+            self.__items = get_byattr_items(self._sh, self.__byattr)
+            self.__generation = _byattr_generation
+        self.__execute_chunk(actionname, self.__items, 0)
+
+    # Set the values of a chunk of items. If byattr_chunk_size is set, the next chunk is set after
+    # byattr_chunk_interval seconds
+    # actionname: name of action for logging
+    # items: tuple of tuples (item, value)
+    # start: index of first item of chunk
+    def __execute_chunk(self, actionname, items, start):
+        chunk_size = AutoBlindDefaults.byattr_chunk_size
+        end = len(items) if chunk_size <= 0 else min(len(items), start + chunk_size)
+        caller = AutoBlindDefaults.plugin_identification
+        if self._log_enabled:
+            for item, value in items[start:end]:
+                self._log_info("\t{0} = {1}", item.id(), value)
+                item(value, caller=caller)
+        else:
+            for item, value in items[start:end]:
+                item(value, caller=caller)
+
+        if end < len(items):
+            self._log_info("{0}: Setting values of {1} remaining items in {2} seconds", actionname, len(items) - end,
+                           AutoBlindDefaults.byattr_chunk_interval)
+            value = {'actionname': actionname, 'items': items, 'start': end}
+            AutoBlindTimer.add((self._abitem.id, self._scheduler_name + "-Chunk"),
+                               AutoBlindDefaults.byattr_chunk_interval, self.__execute_chunk, value)
 
 
 # Class representing a single "as_trigger" action
 class AbActionTrigger(AbActionBase):
+    __slots__ = ("__logic", "__value")
+
     # Initialize the action
     # abitem: parent AbItem instance
     # name: Name of action
@@ -289,12 +415,22 @@ class AbActionTrigger(AbActionBase):
 
 # Class representing a single "as_run" action
 class AbActionRun(AbActionBase):
+    __slots__ = ("__eval", "__eval_code", "__async")
+
     # Initialize the action
     # abitem: parent AbItem instance
     # name: Name of action
     def __init__(self, abitem, name: str):
         super().__init__(abitem, name)
         self.__eval = None
+        self.__eval_code = None
+        self.__async = None
+
+    # Run the action asynchronously
+    def update_async(self, value):
+        if self.__async is None:
+            self.__async = AutoBlindValue.AbValue(self._abitem, "async", False, "bool")
+        self.__async.set(value)
 
     # set the action based on a set_(action_name) attribute
     # value: Value of the set_(action_name) attribute
@@ -306,6 +442,7 @@ class AbActionRun(AbActionBase):
 
         if func == "eval":
             self.__eval = value
+            self.__eval_code = AutoBlindTools.compile_eval(value)
 
     # Complete action
     # item_state: state item to read from
@@ -317,31 +454,50 @@ class AbActionRun(AbActionBase):
         AbActionBase.write_to_logger(self)
         if self.__eval is not None:
             self._log_debug("eval: {0}", AutoBlindTools.get_eval_name(self.__eval))
+        if self.__async is not None:
+            self.__async.write_to_logger()
 
-    # Really execute the action
+    # Really execute the action. The eval is run during the update, so actions are run in the given order. Evals of
+    # asynchronous actions are run by the executor, so slow evals do not block the update. They get a run context with
+    # the variables as they are now, as the AbItem may be updated again while the eval is running
     def _execute(self, actionname: str, repeat_text: str = ""):
+        self._log_info("{0}: Running '{1}'.{2}", actionname, AutoBlindTools.get_eval_name(self.__eval), repeat_text)
+        if self.__async is not None and self.__async.get():
+            context = self._abitem.get_run_context()
+            AutoBlindExecutor.submit(context, actionname, self.__run, actionname, context)
+        else:
+            self.__run(actionname, self._abitem)
+
+    # Run the eval
+    # actionname: name of action for logging
+    # context: AbItem or run context of the AbItem
+    def __run(self, actionname: str, context):
         if isinstance(self.__eval, str):
             # noinspection PyUnusedLocal
             sh = self._sh
             if "autoblind_eval" in self.__eval:
                 # noinspection PyUnusedLocal
-                autoblind_eval = AutoBlindEval.AbEval(self._abitem)
+                autoblind_eval = AutoBlindEval.AbEval(context)
             try:
-                eval(self.__eval)
+                eval(self.__eval_code)
             except Exception as ex:
                 text = "{0}: Problem evaluating '{1}': {2}."
-                self._log_error(text.format(actionname, AutoBlindTools.get_eval_name(self.__eval), str(ex)))
+                context.logger.error(text, actionname, AutoBlindTools.get_eval_name(self.__eval), str(ex))
         else:
             try:
                 # noinspection PyCallingNonCallable
                 self.__eval()
             except Exception as ex:
-                text = "{0}: Problem calling '{0}': {1}."
-                self._log_error(text.format(actionname, AutoBlindTools.get_eval_name(self.__eval), str(ex)))
+                text = "{0}: Problem calling '{1}': {2}."
+                context.logger.error(text, actionname, AutoBlindTools.get_eval_name(self.__eval), str(ex))
 
 
 # Class representing a single "as_force" action
 class AbActionForceItem(AbActionBase):
+    __slots__ = ("__item", "__value", "__mindelta")
+    _uses_write_plan = True
+    _forces_write = True
+
     # Initialize the action
     # abitem: parent AbItem instance
     # name: Name of action
@@ -375,6 +531,11 @@ class AbActionForceItem(AbActionBase):
             self.__mindelta.set_cast(self.__item.cast)
             self._scheduler_name = self.__item.id() + "-AbItemDelayTimer"
 
+    # Replace unused values by shared empty values (after completion)
+    def compact(self):
+        AbActionBase.compact(self)
+        self.__mindelta = AutoBlindValue.AbValue.compact(self.__mindelta)
+
     # Write action to logger
     def write_to_logger(self):
         AbActionBase.write_to_logger(self)
@@ -397,12 +558,21 @@ class AbActionForceItem(AbActionBase):
         return True
 
     # Really execute the action (needs to be implemented in derived classes)
-    # noinspection PyProtectedMember
     def _execute(self, actionname: str, repeat_text: str = ""):
         value = self.__value.get()
-        if value is None:
-            return
+        if value is not None:
+            self._write(value, actionname, repeat_text)
+
+    # Add the item write of the action to a write plan instead of executing it
+    def _plan(self, write_plan, actionname: str, repeat_text: str = ""):
+        value = self.__value.get()
+        if value is not None:
+            write_plan.add(self.__item, self, value, actionname, repeat_text)
 
+    # Write value to item (setting a different value first if required)
+    # returns: True = value has been written, False = value has not been written because of mindelta
+    # noinspection PyProtectedMember
+    def _write(self, value, actionname: str, repeat_text: str = ""):
         if not self.__mindelta.is_empty():
             mindelta = self.__mindelta.get()
             # noinspection PyCallingNonCallable
@@ -410,7 +580,7 @@ class AbActionForceItem(AbActionBase):
             if delta < mindelta:
                 text = "{0}: Not setting '{1}' to '{2}' because delta '{3:.2}' is lower than mindelta '{4}'"
                 self._log_debug(text, actionname, self.__item.id(), value, delta, mindelta)
-                return
+                return False
 
         # Set to different value first ("force")
         if self.__item() == value:
@@ -439,10 +609,13 @@ class AbActionForceItem(AbActionBase):
         self._log_debug("{0}: Set '{1}' to '{2}'.{3}", actionname, self.__item.id(), value, repeat_text)
         # noinspection PyCallingNonCallable
         self.__item(value, caller=AutoBlindDefaults.plugin_identification)
+        return True
 
 
 # Class representing a single "as_special" action
 class AbActionSpecial(AbActionBase):
+    __slots__ = ("__special", "__value")
+
     # Initialize the action
     # abitem: parent AbItem instance
     # name: Name of action
@@ -521,3 +694,58 @@ class AbActionSpecial(AbActionBase):
         suspend_remaining = int(suspend_time - suspend_over + 0.5)   # adding 0.5 causes round up ...
         self._abitem.set_variable("item.suspend_remaining", suspend_remaining)
         self._log_debug("Updated variable 'item.suspend_remaining' to {0}".format(suspend_remaining))
+
+
+# Class collecting the immediate item writes of "as_set" and "as_force" actions during one update. A write replaces
+# earlier writes to the same item. When the plan is flushed, the remaining writes are executed in the order in which
+# they have been added. Writes are not skipped if the item already has the value, as items may enforce updates
+class AbWritePlan(AutoBlindTools.AbItemChild):
+    __slots__ = ("__writes", "__statistics")
+
+    # Initialize the write plan
+    # abitem: parent AbItem instance
+    def __init__(self, abitem):
+        super().__init__(abitem)
+        self.__writes = OrderedDict()
+        self.__statistics = dict.fromkeys(_write_statistics, 0)
+
+    # Add a write
+    # item: item to write
+    # action: action writing the item
+    # value: value to write
+    # actionname: name of action for logging
+    # repeat_text: text for logging
+    def add(self, item, action, value, actionname, repeat_text):
+        self.__statistics["planned"] += 1
+        previous = self.__writes.pop(item.id(), None)
+        if previous is not None:
+            previous_action, previous_value = previous[0], previous[1]
+            # a later "set" to the value of a previous "force" must not remove the force
+            if previous_action._forces_write and not action._forces_write and previous_value == value:
+                action, actionname = previous_action, previous[2]
+            self.__statistics["overwritten"] += 1
+            text = "{0}: Write of '{1}' to '{2}' replaces write of '{3}'"
+            self._log_debug(text, actionname, value, item.id(), previous_value)
+        self.__writes[item.id()] = (action, value, actionname, repeat_text, item)
+
+    # Execute all collected writes and clear the plan
+    # noinspection PyProtectedMember
+    def flush(self):
+        while len(self.__writes) > 0:
+            __, (action, value, actionname, repeat_text, item) = self.__writes.popitem(last=False)
+            if action._write(value, actionname, repeat_text):
+                self.__statistics["written"] += 1
+            else:
+                self.__statistics["mindelta"] += 1
+
+    # Execute remaining writes and add the numbers of this plan to the write statistics
+    def close(self):
+        self.flush()
+        with _write_statistics_lock:
+            for name, count in self.__statistics.items():
+                _write_statistics[name] += count
+        if self.__statistics["planned"] > 0:
+            text = "Item writes: {0} planned, {1} written, {2} overwritten, {3} below mindelta"
+            self._log_debug(text, self.__statistics["planned"], self.__statistics["written"],
+                            self.__statistics["overwritten"], self.__statistics["mindelta"])
+
@@ -32,6 +32,11 @@ class AbActions(AutoBlindTools.AbItemChild):
         self.__unassigned_delays = {}
         self.__unassigned_repeats = {}
         self.__unassigned_orders = {}
+        self.__unassigned_asyncs = {}
+        self.__plans = {}
+        # incremented whenever the actions change, so that plans of other instances using these as additional
+        # actions are rebuilt
+        self.__generation = 0
 
     # Return number of actions in list
     def count(self):
@@ -41,6 +46,8 @@ class AbActions(AutoBlindTools.AbItemChild):
     # attribute: name of attribute that defines action
     # value: value of the attribute
     def update(self, attribute, value):
+        self.__plans.clear()
+        self.__generation += 1
         # Split attribute in function and action name
         func, name = AutoBlindTools.partition_strip(attribute, "_")
         try:
@@ -68,6 +75,14 @@ class AbActions(AutoBlindTools.AbItemChild):
                 else:
                     self.__actions[name].update_order(value)
                 return
+            elif func == "as_async":
+                # set asynchronous execution
+                if name not in self.__actions:
+                    # If we do not have the action yet (async-attribute before action-attribute), ...
+                    self.__unassigned_asyncs[name] = value
+                else:
+                    self.__actions[name].update_async(value)
+                return
             elif func == "as_action":  # and name not in self.__actions:
                 self.__handle_combined_action_attribute(name, value)
             elif self.__ensure_action_exists(func, name):
@@ -115,6 +130,10 @@ class AbActions(AutoBlindTools.AbItemChild):
             action.update_order(self.__unassigned_orders[name])
             del self.__unassigned_orders[name]
 
+        if name in self.__unassigned_asyncs:
+            action.update_async(self.__unassigned_asyncs[name])
+            del self.__unassigned_asyncs[name]
+
         self.__actions[name] = action
         return True
 
@@ -126,7 +145,7 @@ class AbActions(AutoBlindTools.AbItemChild):
             raise ValueError("Attribute 'as_action_{0}': Value must be a string or a list!".format(name))
 
         # parse parameters
-        parameter = {'function': None, 'force': None, 'repeat': None, 'delay': 0, 'order': None}
+        parameter = {'function': None, 'force': None, 'repeat': None, 'delay': 0, 'order': None, 'async': None}
         for entry in value_list:
             key, val = AutoBlindTools.partition_strip(entry, ":")
             if key == "function":
@@ -208,6 +227,8 @@ class AbActions(AutoBlindTools.AbItemChild):
                 self.__actions[name].update_delay(parameter['delay'])
             if parameter['order'] is not None:
                 self.__actions[name].update_order(parameter['order'])
+            if parameter['async'] is not None:
+                self.__actions[name].update_async(parameter['async'])
 
     # noinspection PyMethodMayBeStatic
     def __raise_missing_parameter_error(self, parameter, param_name):
@@ -217,9 +238,12 @@ class AbActions(AutoBlindTools.AbItemChild):
     # Check the actions optimize and complete them
     # item_state: item to read from
     def complete(self, item_state):
+        self.__plans.clear()
+        self.__generation += 1
         for name in self.__actions:
             try:
                 self.__actions[name].complete(item_state)
+                self.__actions[name].compact()
             except ValueError as ex:
                 raise ValueError("State '{0}', Action '{1}': {2}".format(item_state.id(), name, str(ex)))
 
@@ -227,22 +251,36 @@ class AbActions(AutoBlindTools.AbItemChild):
     # is_repeat: Inidicate if this is a repeated action without changing the state
     # item_allow_repeat: Is repeating actions generally allowed for the item?
     # additional_actions: AbActions-Instance containing actions which should be executed, too
-    def execute(self, is_repeat: bool, allow_item_repeat: bool, additional_actions=None):
-        actions = []
-        for name in self.__actions:
-            actions.append((self.__actions[name].get_order(), self.__actions[name]))
+    # write_plan: AbWritePlan-Instance collecting the immediate item writes of the update (None: write directly)
+    def execute(self, is_repeat: bool, allow_item_repeat: bool, additional_actions=None, write_plan=None):
+        for action in self.__get_plan(additional_actions):
+            action.execute(is_repeat, allow_item_repeat, write_plan)
+
+    # Return actions (including additional actions) sorted by order. The sorted list is cached per additional actions
+    # and only rebuilt if the actions or the additional actions change or if an order determined dynamically (item,
+    # eval, variable) changes
+    # additional_actions: AbActions-Instance containing actions which should be executed, too
+    def __get_plan(self, additional_actions=None):
+        additional_generation = None if additional_actions is None else additional_actions.__generation
+        cached = self.__plans.get(additional_actions)
+        if cached is not None and cached[0] == additional_generation:
+            __, dynamic_actions, dynamic_orders, plan = cached
+            if len(dynamic_actions) == 0 or [action.get_order() for action in dynamic_actions] == dynamic_orders:
+                return plan
+
+        actions = list(self.__actions.values())
         if additional_actions is not None:
-            for name in additional_actions.__actions:
-                actions.append((additional_actions.__actions[name].get_order(), additional_actions.__actions[name]))
-        for order, action in sorted(actions, key=lambda x: x[0]):
-            action.execute(is_repeat, allow_item_repeat)
+            actions.extend(additional_actions.__actions.values())
+        orders = [action.get_order() for action in actions]
+        plan = [action for order, action in sorted(zip(orders, actions), key=lambda x: x[0])]
+        dynamic_actions = [action for action in actions if action.has_dynamic_order()]
+        dynamic_orders = [order for order, action in zip(orders, actions) if action.has_dynamic_order()]
+        self.__plans[additional_actions] = (additional_generation, dynamic_actions, dynamic_orders, plan)
+        return plan
 
     # log all actions
     def write_to_logger(self):
-        actions = []
-        for name in self.__actions:
-            actions.append((self.__actions[name].get_order(), self.__actions[name]))
-        for order, action in sorted(actions, key=lambda x: x[0]):
+        for action in self.__get_plan():
             # noinspection PyProtectedMember
             self._log_info("Action '{0}':", action._name)
             self._log_increase_indent()
@@ -18,7 +18,14 @@
 #  You should have received a copy of the GNU General Public License
 #  along with this plugin. If not, see <http://www.gnu.org/licenses/>.
 #########################################################################
+import gc
 import logging
+import sys
+from . import AutoBlindValue
+from . import AutoBlindCondition
+from . import AutoBlindAction
+from . import AutoBlindCurrent
+from . import AutoBlindTimer
 # noinspection PyUnresolvedReferences
 from lib.model.smartplugin import SmartPlugin
 
@@ -39,7 +46,13 @@ class AbCliCommands:
             else:
                 cli.add_command("as_list", self.cli_list, "as_list: list AutoState items")
                 cli.add_command("as_detail", self.cli_detail, "as_detail [asItem]: show details on AutoState item [asItem]")
-                self.logger.info("AutoBlind: Two additional CLI commands registered")
+                cli.add_command("as_memory", self.cli_memory, "as_memory: show memory usage of AutoState objects")
+                cli.add_command("as_current", self.cli_current, "as_current: show current conditions and cache usage")
+                cli.add_command("as_writes", self.cli_writes, "as_writes: show numbers of written and skipped item writes")
+                cli.add_command("as_delays", self.cli_delays, "as_delays: show pending delayed actions")
+                cli.add_command("as_reload_byattr", self.cli_reload_byattr,
+                                "as_reload_byattr: search items for byattr actions again")
+                self.logger.info("AutoBlind: Seven additional CLI commands registered")
         except AttributeError as err:
             self.logger.error("AutoBlind: Additional CLI commands not registered because error occured.")
             self.logger.exception(err)
@@ -59,6 +72,52 @@ class AbCliCommands:
         if item is not None:
             item.cli_detail(handler)
 
+    # CLI command as_memory
+    # noinspection PyUnusedLocal
+    def cli_memory(self, handler, parameter, source):
+        handler.push("Memory usage of AutoState objects\n")
+        handler.push("=================================\n")
+        for line in get_memory_statistics():
+            handler.push(line + "\n")
+
+    # CLI command as_current
+    # noinspection PyUnusedLocal
+    def cli_current(self, handler, parameter, source):
+        values = AutoBlindCurrent.values
+        handler.push("Current conditions\n")
+        handler.push("==================\n")
+        handler.push("Time: {0}, Weekday: {1}, Month: {2}\n".format(values.get_time(), values.get_weekday(),
+                                                                   values.get_month()))
+        handler.push("Sun azimut: {0}, Sun altitude: {1}\n".format(values.get_sun_azimut(), values.get_sun_altitude()))
+        statistics = values.get_statistics()
+        for name in ("time", "sun"):
+            handler.push("Cache '{0}': {1} hits, {2} misses\n".format(name, *statistics[name]))
+        handler.push("Sun table: {0} lookups, {1} builds\n".format(*statistics["sun_table"]))
+
+    # CLI command as_writes
+    # noinspection PyUnusedLocal
+    def cli_writes(self, handler, parameter, source):
+        statistics = AutoBlindAction.get_write_statistics()
+        handler.push("Item writes of actions\n")
+        handler.push("======================\n")
+        for name in ("planned", "written", "overwritten", "mindelta"):
+            handler.push("{0}: {1}\n".format(name, statistics[name]))
+
+    # CLI command as_delays
+    # noinspection PyUnusedLocal
+    def cli_delays(self, handler, parameter, source):
+        pending = AutoBlindTimer.wheel.get_pending() if AutoBlindTimer.wheel is not None else []
+        handler.push("Pending delayed actions: {0}\n".format(len(pending)))
+        handler.push("=========================\n")
+        for due, (item_id, timer_name) in pending:
+            handler.push("{0}: {1} ({2})\n".format(due.strftime("%X"), timer_name, item_id))
+
+    # CLI command as_reload_byattr
+    # noinspection PyUnusedLocal
+    def cli_reload_byattr(self, handler, parameter, source):
+        AutoBlindAction.reload_byattr_items()
+        handler.push("Items for byattr actions will be searched again at their next execution\n")
+
     # get item from parameter
     def __cli_getitem(self, handler, parameter):
         if parameter not in self.__items:
@@ -75,3 +134,54 @@ class AbCliCommands:
             return None
         except Exception:
             return None
+
+
+# Return names of all slots of an object (name mangled as stored in the object)
+# obj: object to return slots for
+def get_slot_names(obj):
+    names = []
+    for cls in type(obj).__mro__:
+        for name in getattr(cls, "__slots__", ()):
+            if name.startswith("__") and not name.endswith("__"):
+                name = "_" + cls.__name__.lstrip("_") + name
+            names.append(name)
+    return names
+
+
+# Determine memory usage of values, conditions and actions and the memory saved by using slots and shared empty
+# values instead of instance dictionaries and individual empty values
+# returns: list of text lines
+def get_memory_statistics():
+    classes = (AutoBlindValue.AbValue, AutoBlindCondition.AbCondition, AutoBlindAction.AbActionBase)
+    statistics = {}
+    empty_values = set(id(value) for value in AutoBlindValue._empty_values.values())
+    empty_references = 0
+    for obj in gc.get_objects():
+        if not isinstance(obj, classes):
+            continue
+        names = get_slot_names(obj)
+        entry = statistics.setdefault(type(obj).__name__, [0, 0, 0])
+        entry[0] += 1
+        entry[1] += sys.getsizeof(obj)
+        # a dictionary holding the same attributes would have been required without slots
+        entry[2] += sys.getsizeof(dict.fromkeys(names))
+        for name in names:
+            if id(getattr(obj, name, None)) in empty_values:
+                empty_references += 1
+
+    lines = []
+    total_size = 0
+    total_saved = 0
+    for name in sorted(statistics):
+        count, size, saved = statistics[name]
+        total_size += size
+        total_saved += saved
+        lines.append("{0}: {1} objects, {2} bytes, about {3} bytes saved by slots".format(name, count, size, saved))
+    # each reference to a shared empty value would have been an individual value with instance dictionary
+    probe = AutoBlindValue.AbValue.__new__(AutoBlindValue.AbValue)
+    value_size = sys.getsizeof(probe) + sys.getsizeof(dict.fromkeys(get_slot_names(probe)))
+    empty_saved = (empty_references - len(empty_values)) * value_size
+    lines.append("Shared empty values: {0} references to {1} objects, about {2} bytes saved".format(
+        empty_references, len(empty_values), empty_saved))
+    lines.append("Total: {0} bytes, about {1} bytes saved".format(total_size, total_saved + empty_saved))
+    return lines
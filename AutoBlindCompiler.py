@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# vim: set encoding=utf-8 tabstop=4 softtabstop=4 shiftwidth=4 expandtab
+#########################################################################
+#  Copyright 2014-     Thomas Ernst                       offline@gmx.net
+#########################################################################
+#  Finite state machine plugin for SmartHomeNG
+#
+#  This plugin is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This plugin is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this plugin. If not, see <http://www.gnu.org/licenses/>.
+#########################################################################
+
+
+# Class generating the source code of a function and compiling it.
+# Objects used by the generated code are passed as default values of arguments, so that they can be accessed as
+# local variables when the function is executed
+class AbCodeGenerator:
+    # Source code of generated function
+    @property
+    def source(self):
+        return self.__source
+
+    # Initialize the code generator
+    # name: Name of function to generate
+    def __init__(self, name: str):
+        self.__name = name
+        self.__constants = {}
+        self.__lines = []
+        self.__source = None
+
+    # Register an object to be used by the generated code
+    # value: object to register
+    # returns: name of variable containing the object in the generated code
+    def constant(self, value):
+        name = "c{0}".format(len(self.__constants))
+        self.__constants[name] = value
+        return name
+
+    # Add a line to the body of the generated function
+    # text: source code of line
+    # indent: indentation level of line (1 = body of function)
+    def line(self, text, indent=1):
+        self.__lines.append("    " * indent + text)
+
+    # Generate and compile the function
+    # returns: compiled function
+    def build(self):
+        arguments = ", ".join("{0}={0}".format(name) for name in self.__constants)
+        self.__source = "def {0}({1}):\n{2}\n".format(self.__name, arguments, "\n".join(self.__lines))
+        namespace = dict(self.__constants)
+        exec(compile(self.__source, "<{0}>".format(self.__name), "exec"), namespace)
+        return namespace[self.__name]
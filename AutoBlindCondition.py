@@ -26,6 +26,10 @@ from . import AutoBlindEval
 
 # Class representing a single condition
 class AbCondition(AutoBlindTools.AbItemChild):
+    __slots__ = ("__name", "__item", "__eval", "__eval_code", "__value", "__min", "__max", "__negate", "__agemin",
+                 "__agemax", "__agenegate", "__error", "__value_set", "__value_str_set", "__value_type", "__cost",
+                 "__count_checks", "__count_rejections")
+
     # Name of condition
     @property
     def name(self):
@@ -39,6 +43,7 @@ class AbCondition(AutoBlindTools.AbItemChild):
         self.__name = name
         self.__item = None
         self.__eval = None
+        self.__eval_code = None
         self.__value = AutoBlindValue.AbValue(self._abitem, "value", True)
         self.__min = AutoBlindValue.AbValue(self._abitem, "min")
         self.__max = AutoBlindValue.AbValue(self._abitem, "max")
@@ -47,6 +52,12 @@ class AbCondition(AutoBlindTools.AbItemChild):
         self.__agemax = AutoBlindValue.AbValue(self._abitem, "agemax")
         self.__agenegate = None
         self.__error = None
+        self.__value_set = None
+        self.__value_str_set = None
+        self.__value_type = None
+        self.__cost = 1
+        self.__count_checks = 0
+        self.__count_rejections = 0
 
     # set a certain function to a given value
     # func: Function to set ('item', 'eval', 'value', 'min', 'max', 'negate', 'agemin', 'agemax' or 'agenegate'
@@ -131,6 +142,13 @@ class AbCondition(AutoBlindTools.AbItemChild):
         if self.__item is None and self.__eval is None:
             raise ValueError("Condition {}: Neither 'item' nor 'eval' given!".format(self.__name))
 
+        # compile eval expression, so that only the code object needs to be executed on each update
+        if isinstance(self.__eval, str):
+            try:
+                self.__eval_code = AutoBlindTools.compile_eval(self.__eval)
+            except ValueError as ex:
+                raise ValueError("Condition {0}: {1}".format(self.__name, str(ex)))
+
         # cast stuff
         try:
             if self.__item is not None:
@@ -146,6 +164,27 @@ class AbCondition(AutoBlindTools.AbItemChild):
         except Exception as ex:
             raise ValueError("Condition {0}: Error when casting: {1}".format(self.__name, str(ex)))
 
+        # laststate: compare positions of states instead of ids if all given values are states of the item
+        if self.__name == "laststate" and self.__eval == self._abitem.get_laststate_id \
+                and self.__value.get_type() == "value" and self.__min.is_empty() and self.__max.is_empty():
+            value = self.__value.get()
+            state_ids = value if isinstance(value, list) else [value]
+            if all(self._abitem.get_state_position(state_id) is not None for state_id in state_ids):
+                self.__value.set_cast(self._abitem.get_state_position)
+                self.__eval = self._abitem.get_laststate_position
+
+        # list of fixed values: prepare sets for fast membership checks
+        if self.__value.get_type() == "value" and isinstance(self.__value.get(), list):
+            value = self.__value.get()
+            try:
+                self.__value_set = frozenset((type(element), element) for element in value)
+            except TypeError:
+                self.__value_set = None
+            else:
+                self.__value_str_set = frozenset(str(element) for element in value)
+                value_types = {type(element) for element in value}
+                self.__value_type = value_types.pop() if len(value_types) == 1 else None
+
         # 'min' must not be greater than 'max'
         if self.__min.get_type() == "value" and self.__max.get_type() == "value":
             if self.__min.get() > self.__max.get():
@@ -155,8 +194,32 @@ class AbCondition(AutoBlindTools.AbItemChild):
         if self.__item is None and not (self.__agemin.is_empty() and self.__agemax.is_empty()):
             raise ValueError("Condition {}: 'agemin'/'agemax' can not be used for eval!".format(self.__name))
 
+        # estimate cost of checking this condition
+        if self.__item is not None:
+            self.__cost = 2
+        elif isinstance(self.__eval, str):
+            self.__cost = 10
+        else:
+            self.__cost = 1
+        for value in (self.__value, self.__min, self.__max, self.__agemin, self.__agemax):
+            self.__cost += value.get_cost()
+        if not (self.__agemin.is_empty() and self.__agemax.is_empty()):
+            self.__cost += 2
+
+        # replace unused values by shared empty values
+        self.__value = AutoBlindValue.AbValue.compact(self.__value)
+        self.__min = AutoBlindValue.AbValue.compact(self.__min)
+        self.__max = AutoBlindValue.AbValue.compact(self.__max)
+        self.__agemin = AutoBlindValue.AbValue.compact(self.__agemin)
+        self.__agemax = AutoBlindValue.AbValue.compact(self.__agemax)
+
         return True
 
+    # Return rank of condition: The lower the rank, the earlier the condition should be checked.
+    # The rank is the estimated cost of checking the condition divided by the measured rate of rejections
+    def get_rank(self):
+        return self.__cost * (self.__count_checks + 2) / (self.__count_rejections + 1)
+
     # Check if condition is matching
     def check(self):
         # Ignore if no current value can be determined (should not happen as we check this earlier, but to be sure ...)
@@ -164,12 +227,135 @@ class AbCondition(AutoBlindTools.AbItemChild):
             self._log_info("condition '{0}': No item or eval found! Considering condition as matching!", self.__name)
             return True
 
-        if not self.__check_value():
-            return False
-        if not self.__check_age():
+        # count checks and rejections for ordering of conditions. Halve counters from time to time so that
+        # changes in the rejection rate are recognized
+        if self.__count_checks >= 1000:
+            self.__count_checks //= 2
+            self.__count_rejections //= 2
+        self.__count_checks += 1
+
+        if not self.__check_value() or not self.__check_age():
+            self.__count_rejections += 1
             return False
         return True
 
+    # Add checks and rejections counted by a compiled condition set
+    # checks: number of checks
+    # rejections: number of rejections
+    def add_statistics(self, checks, rejections):
+        self.__count_checks += checks
+        self.__count_rejections += rejections
+        while self.__count_checks >= 1000:
+            self.__count_checks //= 2
+            self.__count_rejections //= 2
+
+    # Generate code checking this condition. The generated code returns the given position if the condition is
+    # not matching. Fixed limits are inserted as constants, parts depending on dynamic limits call the
+    # interpreted check
+    # generator: AbCodeGenerator instance
+    # position: position of condition in condition set
+    def generate_code(self, generator, position):
+        generator.line("# condition '{0}'".format(self.__name))
+        if self.__value.get_type() == "value":
+            self.__generate_code_current(generator)
+            value = self.__value.get()
+            if isinstance(value, list):
+                expression = "{0}({1}, current)".format(
+                    generator.constant(self.__list_contains), generator.constant(value))
+            else:
+                expression = "(current == {0} if type(current) is {1} else str(current) == {2})".format(
+                    generator.constant(value), generator.constant(type(value)), generator.constant(str(value)))
+            if self.__negate:
+                generator.line("if {0}:".format(expression))
+            else:
+                generator.line("if not {0}:".format(expression))
+            generator.line("return {0}".format(position), 2)
+        elif self.__value.is_empty() and self.__min.get_type() in ("value", None) \
+                and self.__max.get_type() in ("value", None):
+            if not (self.__min.is_empty() and self.__max.is_empty()):
+                self.__generate_code_current(generator)
+                self.__generate_code_limits(generator, "current", self.__min, self.__max, self.__negate, position)
+        else:
+            generator.line("if not {0}():".format(generator.constant(self.__check_value)))
+            generator.line("return {0}".format(position), 2)
+
+        if self.__agemin.is_empty() and self.__agemax.is_empty():
+            return
+        if self.__agemin.get_type() in ("value", None) and self.__agemax.get_type() in ("value", None):
+            generator.line("age = {0}.age()".format(generator.constant(self.__item)))
+            self.__generate_code_limits(generator, "age", self.__agemin, self.__agemax, self.__agenegate, position)
+        else:
+            generator.line("if not {0}():".format(generator.constant(self.__check_age)))
+            generator.line("return {0}".format(position), 2)
+
+    # Generate code determining the current value of the condition
+    # generator: AbCodeGenerator instance
+    def __generate_code_current(self, generator):
+        if self.__item is not None:
+            generator.line("current = {0}({1})".format(
+                generator.constant(self._abitem.get_item_value), generator.constant(self.__item)))
+        elif isinstance(self.__eval, str):
+            generator.line("current = {0}({1}, {2})".format(
+                generator.constant(self._abitem.get_eval_value), generator.constant(self.__eval),
+                generator.constant(self.__evaluate)))
+        else:
+            generator.line("current = {0}()".format(generator.constant(self.__eval)))
+
+    # Generate code checking fixed limits (same logic as in __check_value and __check_age)
+    # generator: AbCodeGenerator instance
+    # variable: name of variable containing the value to check
+    # min_value: AbValue instance containing the lower limit
+    # max_value: AbValue instance containing the upper limit
+    # negate: Flag: negate check
+    # position: position of condition in condition set
+    @staticmethod
+    def __generate_code_limits(generator, variable, min_value, max_value, negate, position):
+        min_name = None if min_value.is_empty() else generator.constant(min_value.get())
+        max_name = None if max_value.is_empty() else generator.constant(max_value.get())
+        if not negate:
+            if min_name is not None:
+                generator.line("if {0} < {1}:".format(variable, min_name))
+                generator.line("return {0}".format(position), 2)
+            if max_name is not None:
+                generator.line("if {0} > {1}:".format(variable, max_name))
+                generator.line("return {0}".format(position), 2)
+        elif min_name is not None and max_name is not None:
+            generator.line("if {1} < {0} < {2}:".format(variable, min_name, max_name))
+            generator.line("return {0}".format(position), 2)
+        elif min_name is not None:
+            generator.line("if {0} > {1}:".format(variable, min_name))
+            generator.line("return {0}".format(position), 2)
+        elif max_name is not None:
+            generator.line("if {0} < {1}:".format(variable, max_name))
+            generator.line("return {0}".format(position), 2)
+
+    # Return fixed values and limits of a condition based on current time, date or sun position
+    # returns: tuple (name of condition, list of fixed values and limits) or None for other conditions
+    def get_wakeup_limits(self):
+        if self.__item is not None or isinstance(self.__eval, str):
+            return None
+        if self.__name not in ("time", "sun_azimut", "sun_altitude", "weekday", "month"):
+            return None
+        limits = []
+        for value in (self.__value, self.__min, self.__max):
+            if value.get_type() == "value":
+                limit = value.get()
+                limits.extend(limit if isinstance(limit, list) else [limit])
+        return self.__name, limits
+
+    # Return ids of the items the condition depends on
+    # returns: set of item ids or None if the condition depends on anything else than item values (eval, age, ...)
+    def get_dependencies(self):
+        if self.__item is None or not (self.__agemin.is_empty() and self.__agemax.is_empty()):
+            return None
+        dependencies = {self.__item.id()}
+        for value in (self.__value, self.__min, self.__max):
+            value_dependencies = value.get_dependencies()
+            if value_dependencies is None:
+                return None
+            dependencies |= value_dependencies
+        return dependencies
+
     # Write condition to logger
     def write_to_logger(self):
         if self.__error is not None:
@@ -214,18 +400,13 @@ class AbCondition(AutoBlindTools.AbItemChild):
                     self._log_debug(text, self.__name, value, self.__negate, current)
                     self._log_increase_indent()
 
-                    for element in value:
-                        if type(element) != type(current):
-                            element = str(element)
-                            current = str(current)
+                    if self.__list_contains(value, current):
                         if self.__negate:
-                            if current == element:
-                                self._log_debug("{0} found but negated -> not matching", element)
-                                return False
+                            self._log_debug("{0} found but negated -> not matching", current)
+                            return False
                         else:
-                            if current == element:
-                                self._log_debug("{0} found -> matching", element)
-                                return True
+                            self._log_debug("{0} found -> matching", current)
+                            return True
 
                     if self.__negate:
                         self._log_debug("{0} not in list -> matching", current)
@@ -291,6 +472,30 @@ class AbCondition(AutoBlindTools.AbItemChild):
         finally:
             self._log_decrease_indent()
 
+    # Check if current value is contained in list of values. If current value and list element have different types,
+    # both are compared as strings
+    # value: list of values
+    # current: current value
+    def __list_contains(self, value, current):
+        if self.__value_set is not None:
+            try:
+                if (type(current), current) in self.__value_set:
+                    return True
+            except TypeError:
+                pass
+            else:
+                if type(current) is self.__value_type:
+                    return False
+            return str(current) in self.__value_str_set
+
+        for element in value:
+            if type(element) != type(current):
+                if str(element) == str(current):
+                    return True
+            elif element == current:
+                return True
+        return False
+
     # Check if age conditions match
     def __check_age(self):
         # No limits given -> OK
@@ -337,23 +542,24 @@ class AbCondition(AutoBlindTools.AbItemChild):
     # Current value of condition (based on item or eval)
     def __get_current(self):
         if self.__item is not None:
-            # noinspection PyCallingNonCallable
-            return self.__item()
+            return self._abitem.get_item_value(self.__item)
         if self.__eval is not None:
             if isinstance(self.__eval, str):
-                # noinspection PyUnusedLocal
-                sh = self._sh
-                if "autoblind_eval" in self.__eval:
-                    # noinspection PyUnusedLocal
-                    autoblind_eval = AutoBlindEval.AbEval(self._abitem)
-                try:
-                    value = eval(self.__eval)
-                except Exception as ex:
-                    text = "Condition {}: problem evaluating {}: {}"
-                    raise ValueError(text.format(self.__name, str(self.__eval), str(ex)))
-                else:
-                    return value
+                return self._abitem.get_eval_value(self.__eval, self.__evaluate)
             else:
                 # noinspection PyCallingNonCallable
                 return self.__eval()
         raise ValueError("Condition {}: Neither 'item' nor eval given!".format(self.__name))
+
+    # Evaluate eval expression of condition
+    def __evaluate(self):
+        # noinspection PyUnusedLocal
+        sh = self._sh
+        if "autoblind_eval" in self.__eval:
+            # noinspection PyUnusedLocal
+            autoblind_eval = AutoBlindEval.AbEval(self._abitem)
+        try:
+            return eval(self.__eval_code)
+        except Exception as ex:
+            text = "Condition {}: problem evaluating {}: {}"
+            raise ValueError(text.format(self.__name, str(self.__eval), str(ex)))
@@ -20,6 +20,12 @@
 #########################################################################
 from . import AutoBlindCondition
 from . import AutoBlindTools
+from . import AutoBlindCompiler
+from .AutoBlindLogger import AbLogger
+
+# Maximum number of functions compiled per condition set (one per order of the conditions). When reached, the order
+# is only changed to orders already compiled, so that compiling during updates stops
+_compiled_orders_limit = 8
 
 
 # Class representing a set of conditions
@@ -34,6 +40,11 @@ class AbConditionSet(AutoBlindTools.AbItemChild):
     def conditions(self):
         return self.__conditions
 
+    # Ids of items the condition set depends on (None if condition set depends on anything else than items)
+    @property
+    def dependencies(self):
+        return self.__dependencies
+
     # Initialize the condition set
     # abitem: parent AbItem instance
     # name: Name of condition set
@@ -41,6 +52,15 @@ class AbConditionSet(AutoBlindTools.AbItemChild):
         super().__init__(abitem)
         self.__name = name
         self.__conditions = {}
+        self.__check_order = []
+        self.__checks_since_sort = 0
+        self.__dependencies = None
+        self.__use_cache = False
+        self.__cached_result = None
+        self.__compiled = None
+        self.__compiled_functions = {}
+        self.__compiled_checks = 0
+        self.__compiled_rejections = []
 
     # Update condition set
     # item: item containing settings for condition set
@@ -96,6 +116,77 @@ class AbConditionSet(AutoBlindTools.AbItemChild):
         for name in conditions_to_remove:
             del self.conditions[name]
 
+        # Initial order of checks based on estimated cost
+        self.__check_order = list(self.__conditions.values())
+        self.__sort_check_order()
+
+        # Determine items the condition set depends on
+        self.__dependencies = set()
+        for name in self.__conditions:
+            dependencies = self.__conditions[name].get_dependencies()
+            if dependencies is None:
+                self.__dependencies = None
+                break
+            self.__dependencies |= dependencies
+
+    # Generate a function checking all conditions of the condition set in the current order. The functions are kept
+    # per order, so returning to an order used before does not compile again
+    def compile(self):
+        order = self.__get_order_key()
+        function = self.__compiled_functions.get(order)
+        if function is None:
+            generator = AutoBlindCompiler.AbCodeGenerator("check_condition_set")
+            for position, condition in enumerate(self.__check_order):
+                condition.generate_code(generator, position)
+            generator.line("return -1")
+            try:
+                function = generator.build()
+            except Exception as ex:
+                self.__compiled = None
+                text = "Condition set '{0}': Compiling failed, conditions will be interpreted: {1}"
+                self._log_warning(text, self.__name, str(ex))
+                return
+            self.__compiled_functions[order] = function
+        self.__compiled = function
+        self.__compiled_checks = 0
+        self.__compiled_rejections = [0] * len(self.__check_order)
+
+    # Sort conditions so that cheap conditions which are likely to fail are checked first
+    def __sort_check_order(self):
+        if self.__compiled is not None:
+            # hand over statistics of compiled checks to conditions. A condition has been checked if none of
+            # the conditions before has rejected
+            checks = self.__compiled_checks
+            for position, condition in enumerate(self.__check_order):
+                condition.add_statistics(checks, self.__compiled_rejections[position])
+                checks -= self.__compiled_rejections[position]
+            self.__compiled_checks = 0
+            self.__compiled_rejections = [0] * len(self.__check_order)
+
+        previous_order = list(self.__check_order)
+        self.__check_order.sort(key=lambda condition: condition.get_rank())
+        self.__checks_since_sort = 0
+
+        if self.__compiled is not None and previous_order != self.__check_order:
+            if self.__get_order_key() not in self.__compiled_functions \
+                    and len(self.__compiled_functions) >= _compiled_orders_limit:
+                # order is not stable: keep the current order instead of compiling again and again
+                self.__check_order = previous_order
+            else:
+                self.compile()
+
+    # Return key of the current order of conditions
+    def __get_order_key(self):
+        return tuple(condition.name for condition in self.__check_order)
+
+    # Enable caching of the result. Only allowed if all dependencies are triggering updates of the AbItem
+    def enable_cache(self):
+        self.__use_cache = True
+
+    # Drop cached result, so that the conditions are checked again on next check
+    def invalidate_cache(self):
+        self.__cached_result = None
+
     # Write the whole condition set to the logger
     def write_to_logger(self):
         for name in self.__conditions:
@@ -107,11 +198,58 @@ class AbConditionSet(AutoBlindTools.AbItemChild):
     # Check all conditions in the condition set. Return
     # returns: True = all conditions in set are matching, False = at least one condition is not matching
     def all_conditions_matching(self):
+        if self.__cached_result is not None:
+            text = "Check condition set '{0}': Items unchanged, using previous result {1}"
+            self._log_info(text, self.__name, self.__cached_result)
+            return self.__cached_result
+
+        if self.__compiled is not None and AbLogger.get_loglevel() < 2:
+            result = self.__check_compiled()
+        else:
+            result = self.__check_all_conditions()
+        if self.__use_cache:
+            self.__cached_result = result
+        return result
+
+    # Check all conditions in the condition set using the compiled function (no detailed logging)
+    # returns: True = all conditions in set are matching, False = at least one condition is not matching
+    def __check_compiled(self):
+        # update order of conditions from time to time based on the rejection rates
+        self.__checks_since_sort += 1
+        if self.__checks_since_sort >= 20:
+            self.__sort_check_order()
+
+        position = self.__compiled()
+        self.__compiled_checks += 1
+        if position < 0:
+            if self._log_enabled:
+                self._log_info("Check condition set '{0}': All conditions matching", self.__name)
+            return True
+        self.__compiled_rejections[position] += 1
+        if self._log_enabled:
+            text = "Check condition set '{0}': Condition '{1}' not matching"
+            self._log_info(text, self.__name, self.__check_order[position].name)
+        return False
+
+    # Check all conditions in the condition set
+    # returns: True = all conditions in set are matching, False = at least one condition is not matching
+    def __check_all_conditions(self):
+        # update order of conditions from time to time based on the rejection rates
+        self.__checks_since_sort += 1
+        if self.__checks_since_sort >= 20:
+            self.__sort_check_order()
+
+        if not self._log_enabled:
+            for condition in self.__check_order:
+                if not condition.check():
+                    return False
+            return True
+
         try:
             self._log_info("Check condition set '{0}':", self.__name)
             self._log_increase_indent()
-            for name in self.__conditions:
-                if not self.__conditions[name].check():
+            for condition in self.__check_order:
+                if not condition.check():
                     return False
             return True
         finally:
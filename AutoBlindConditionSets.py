@@ -30,6 +30,11 @@ class AbConditionSets(AutoBlindTools.AbItemChild):
         super().__init__(abitem)
         self.__condition_sets = {}
 
+    # List of condition sets
+    @property
+    def condition_sets(self):
+        return self.__condition_sets
+
     # Return number of condition sets in list
     def count(self):
         return len(self.__condition_sets)
@@ -51,6 +56,11 @@ class AbConditionSets(AutoBlindTools.AbItemChild):
         for name in self.__condition_sets:
             self.__condition_sets[name].complete(item_state)
 
+    # Compile the condition sets
+    def compile(self):
+        for name in self.__condition_sets:
+            self.__condition_sets[name].compile()
+
     # Write all condition sets to logger
     def write_to_logger(self):
         for name in self.__condition_sets:
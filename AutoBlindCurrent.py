@@ -20,69 +20,367 @@
 #########################################################################
 import time
 import math
+import logging
 import datetime
+import threading
 from random import randint
 
 # Static current conditions object
 values = None
 """:type : AbCurrent"""
 
+# Flag: current conditions are held and not updated (while a batch of updates is running)
+_hold = False
+
 
 # Init current conditions
-def init(smarthome):
+# smarthome: Instance of smarthome.py-class
+# sun_cache_time: time (seconds) for which a determined sun position is reused (only if sun_table is False)
+# sun_table: determine sun positions from a precomputed daily table
+def init(smarthome, sun_cache_time=30, sun_table=True):
     global values
-    values = AbCurrent(smarthome)
+    values = AbCurrent(smarthome, sun_cache_time, sun_table)
 
 
-# Update current conditions
+# Update current conditions (unless they are held)
 def update():
-    values.update()
+    if not _hold:
+        values.update()
+
 
+# Hold current conditions, so that calls of update() do not change them
+# active: True = hold current conditions, False = release current conditions
+def hold(active):
+    global _hold
+    _hold = active
 
-# Class representing the current conditions to check against
+
+# Class representing the current conditions to check against. The values are determined on first access after an
+# update. The sun position is reused for a configurable time, as determining it is expensive
 class AbCurrent:
     # Initialize
     # smarthome: Instance of smarthome.py-class
-    def __init__(self, smarthome):
+    # sun_cache_time: time (seconds) for which a determined sun position is reused (only if sun_table is False)
+    # sun_table: determine sun positions from a precomputed daily table
+    def __init__(self, smarthome, sun_cache_time=30, sun_table=True):
         self.__sh = smarthome
+        self.__sun_cache_time = sun_cache_time
+        self.__sun_table = AbSunTable(smarthome) if sun_table else None
         self.__weekday = None
         self.__time = None
         self.__sun_azimut = None
         self.__sun_altitude = None
+        self.__sun_determined = None
         self.__month = None
-        self.update()
+        self.__time_valid = False
+        self.__statistics = {"time": [0, 0], "sun": [0, 0], "sun_table": [0, 0]}
+        self.__statistics_lock = threading.Lock()
 
     # Return current weekday
     def get_weekday(self):
+        self.__determine_time()
         return self.__weekday
 
     # Return current time
     def get_time(self):
+        self.__determine_time()
         return self.__time
 
     # Return current sun_azimut
     def get_sun_azimut(self):
+        self.__determine_sun()
         return self.__sun_azimut
 
     # Return current sun_altitude
     def get_sun_altitude(self):
+        self.__determine_sun()
         return self.__sun_altitude
 
     # Return current month
     def get_month(self):
+        self.__determine_time()
         return self.__month
 
+    # Return statistics of cached values
+    # returns: dict (key: "time" or "sun", value: tuple of number of cache hits and cache misses;
+    #          key "sun_table": tuple of number of lookups in the sun table and number of builds of the table)
+    def get_statistics(self):
+        with self.__statistics_lock:
+            statistics = {name: tuple(counts) for name, counts in self.__statistics.items()}
+        if self.__sun_table is not None:
+            statistics["sun_table"] = (statistics["sun_table"][0], self.__sun_table.get_build_count())
+        return statistics
+
+    # Count a cache hit or miss (updates may run in several threads)
+    # name: name of cached value
+    # index: 0 = hit (or lookup), 1 = miss
+    def __count(self, name, index):
+        with self.__statistics_lock:
+            self.__statistics[name][index] += 1
+
     # Return random number between 0 and 100
     # noinspection PyMethodMayBeStatic
     def get_random(self):
         return randint(0, 100)
 
-    # Update current values
+    # Return the next point in time at which the sun crosses one of the given azimut or altitude values
+    # azimuts: azimut values (degrees) to check
+    # altitudes: altitude values (degrees) to check
+    # horizon: maximum number of minutes to look ahead
+    # step: number of minutes between two checked sun positions
+    # returns: datetime (precision: one minute) or None if no crossing within horizon
+    def get_next_sun_crossing(self, azimuts, altitudes, horizon=1440, step=10):
+        if len(azimuts) == 0 and len(altitudes) == 0:
+            return None
+        now = self.__sh.now()
+        if self.__sun_table is not None:
+            return self.__sun_table.get_next_crossing(now, azimuts, altitudes, horizon)
+        previous_offset = 0
+        previous_pos = self.__get_sun_pos(0)
+        for offset in range(step, horizon + step, step):
+            pos = self.__get_sun_pos(offset)
+            if self.__sun_crossing(previous_pos, pos, azimuts, altitudes):
+                # narrow down to one minute
+                low, low_pos, high = previous_offset, previous_pos, offset
+                while high - low > 1:
+                    middle = (low + high) // 2
+                    middle_pos = self.__get_sun_pos(middle)
+                    if self.__sun_crossing(low_pos, middle_pos, azimuts, altitudes):
+                        high = middle
+                    else:
+                        low, low_pos = middle, middle_pos
+                # offsets are real minutes, so add them in UTC (adding to local time fails on DST changes)
+                return (now.astimezone(datetime.timezone.utc) + datetime.timedelta(minutes=high)).astimezone(now.tzinfo)
+            previous_offset, previous_pos = offset, pos
+        return None
+
+    # Return sun position (azimut, altitude in degrees) at a given offset
+    # offset: offset from now in minutes
+    def __get_sun_pos(self, offset):
+        azimut, altitude = self.__sh.sun.pos(offset)
+        return math.degrees(float(azimut)), math.degrees(float(altitude))
+
+    # Check if one of the given values is crossed between two sun positions
+    # pos1, pos2: sun positions (azimut, altitude in degrees)
+    # azimuts: azimut values (degrees) to check
+    # altitudes: altitude values (degrees) to check
+    @staticmethod
+    def __sun_crossing(pos1, pos2, azimuts, altitudes):
+        # azimut jumps from 360 to 0 at north. Ignore azimut in this case
+        if abs(pos2[0] - pos1[0]) < 180:
+            for azimut in azimuts:
+                if (pos1[0] - azimut) * (pos2[0] - azimut) <= 0 and pos1[0] != pos2[0]:
+                    return True
+        for altitude in altitudes:
+            if (pos1[1] - altitude) * (pos2[1] - altitude) <= 0 and pos1[1] != pos2[1]:
+                return True
+        return False
+
+    # Update current values: time based values are determined again on next access, the sun position when it is older
+    # than the cache time
     def update(self):
+        self.__time_valid = False
+
+    # Determine time based values if required
+    def __determine_time(self):
+        if self.__time_valid:
+            self.__count("time", 0)
+            return
+        self.__count("time", 1)
         now = time.localtime()
         self.__weekday = now.tm_wday
         self.__time = datetime.datetime.time(datetime.datetime.now())
         self.__month = now.tm_mon
+        self.__time_valid = True
+
+    # Determine sun position if not determined yet or if it is older than the cache time
+    def __determine_sun(self):
+        if self.__sun_table is not None:
+            # lookups in the table are cheap and always up to date, so sun_cache_time is not used
+            self.__count("sun_table", 0)
+            self.__sun_azimut, self.__sun_altitude = self.__sun_table.get_pos(self.__sh.now())
+            return
+        now = time.monotonic()
+        if self.__sun_determined is not None and now - self.__sun_determined < self.__sun_cache_time:
+            self.__count("sun", 0)
+            return
+        self.__count("sun", 1)
         azimut, altitude = self.__sh.sun.pos()
         self.__sun_azimut = math.degrees(float(azimut))
         self.__sun_altitude = math.degrees(float(altitude))
+        self.__sun_determined = now
+
+
+# Class representing a table of sun positions (one sample per minute) for two days. The table is built on first
+# access, sun positions are interpolated from the table. The table is indexed by real (UTC) minutes, so it stays correct
+# on days with DST changes. When half of the first day has passed, the next table is built in the background. The
+# current table is used until the next one is ready, so lookups only wait for a build if no table covers them
+class AbSunTable:
+    # Initialize
+    # smarthome: Instance of smarthome.py-class
+    # resolution: minutes between two samples
+    def __init__(self, smarthome, resolution=1):
+        self.logger = logging.getLogger(__name__)
+        self.__sh = smarthome
+        self.__resolution = resolution
+        self.__lock = threading.Lock()
+        # current table: tuple (start (UTC), end (UTC), azimuts, altitudes). Replaced as a whole, never changed
+        self.__table = None
+        self.__building = False
+        self.__build_count = 0
+
+    # Return number of builds of the table
+    def get_build_count(self):
+        return self.__build_count
+
+    # Return interpolated sun position
+    # dt: point in time (timezone aware datetime)
+    # returns: azimut, altitude (degrees)
+    def get_pos(self, dt):
+        table = self.__get_table(dt, 0)
+        return self.__interpolate(table, self.__get_position(table, dt))
+
+    # Return the next point in time at which the sun crosses one of the given azimut or altitude values
+    # dt: point in time to start search at (timezone aware datetime)
+    # azimuts: azimut values (degrees) to check
+    # altitudes: altitude values (degrees) to check
+    # horizon: maximum number of minutes to look ahead
+    # returns: datetime or None if no crossing within horizon
+    def get_next_crossing(self, dt, azimuts, altitudes, horizon=1440):
+        table = self.__get_table(dt, horizon)
+        start, end, table_azimuts, table_altitudes = table
+        position = self.__get_position(table, dt)
+        first = int(position) + 1
+        last = min(len(table_altitudes) - 1, int(position + horizon / self.__resolution))
+        if last < first:
+            return None
+        azimut, altitude = self.__interpolate(table, position)
+
+        # series to check: current position followed by the samples within the horizon
+        positions = [position] + list(range(first, last + 1))
+        series_azimuts = [azimut] + list(table_azimuts[first:last + 1])
+        series_altitudes = [altitude] + list(table_altitudes[first:last + 1])
+        crossing = self.__find_crossing(series_azimuts, series_altitudes, azimuts, altitudes)
+        if crossing is None:
+            return None
+        index, fraction = crossing
+        crossing_position = positions[index] + (positions[index + 1] - positions[index]) * fraction
+        crossing = start + datetime.timedelta(minutes=crossing_position * self.__resolution)
+        return crossing.astimezone(dt.tzinfo)
+
+    # Return interpolated sun position at a position within a table
+    # table: table to use
+    # position: position within the table (number of samples since start of table)
+    # returns: azimut, altitude (degrees)
+    @staticmethod
+    def __interpolate(table, position):
+        start, end, azimuts, altitudes = table
+        index = min(int(position), len(altitudes) - 2)
+        fraction = position - index
+        azimut1 = azimuts[index]
+        azimut2 = azimuts[index + 1]
+        if azimut2 - azimut1 > 180:
+            azimut2 -= 360
+        elif azimut2 - azimut1 < -180:
+            azimut2 += 360
+        azimut = (azimut1 + (azimut2 - azimut1) * fraction) % 360
+        altitude = altitudes[index] + (altitudes[index + 1] - altitudes[index]) * fraction
+        return float(azimut), float(altitude)
+
+    # Find first crossing within a series of sun positions
+    # series_azimuts, series_altitudes: series of sun positions to check
+    # azimuts, altitudes: values to check
+    # returns: tuple (index of segment within series, fraction within segment) or None
+    @staticmethod
+    def __find_crossing(series_azimuts, series_altitudes, azimuts, altitudes):
+        for index in range(len(series_altitudes) - 1):
+            fractions = []
+            azimut1, azimut2 = series_azimuts[index], series_azimuts[index + 1]
+            # azimut jumps from 360 to 0 at north. Ignore azimut in this case
+            if abs(azimut2 - azimut1) < 180 and azimut1 != azimut2:
+                for value in azimuts:
+                    if (azimut1 - value) * (azimut2 - value) <= 0:
+                        fractions.append((value - azimut1) / (azimut2 - azimut1))
+            altitude1, altitude2 = series_altitudes[index], series_altitudes[index + 1]
+            if altitude1 != altitude2:
+                for value in altitudes:
+                    if (altitude1 - value) * (altitude2 - value) <= 0:
+                        fractions.append((value - altitude1) / (altitude2 - altitude1))
+            if len(fractions) > 0:
+                return index, min(fractions)
+        return None
+
+    # Return position of a point in time within a table (number of samples since start of table)
+    # table: table to use
+    # dt: point in time (timezone aware datetime)
+    def __get_position(self, table, dt):
+        return (dt.astimezone(datetime.timezone.utc) - table[0]).total_seconds() / 60 / self.__resolution
+
+    # Return a table covering the given point in time and the given number of minutes after it. The table is built
+    # if no table covers them. The next table is built in the background when half of the first day has passed
+    # dt: point in time (timezone aware datetime)
+    # horizon: number of minutes after dt which have to be covered
+    def __get_table(self, dt, horizon):
+        dt = dt.astimezone(datetime.timezone.utc)
+        table = self.__table
+        if self.__covers(table, dt, horizon):
+            if dt >= table[0] + datetime.timedelta(hours=12) and not self.__building:
+                self.__build_background(dt)
+            return table
+        with self.__lock:
+            table = self.__table
+            if not self.__covers(table, dt, horizon):
+                table = self.__build(dt)
+                self.__table = table
+                self.__build_count += 1
+        return table
+
+    # Check if a table covers a point in time and a number of minutes after it
+    # table: table to check (may be None)
+    # dt: point in time (UTC)
+    # horizon: number of minutes after dt
+    @staticmethod
+    def __covers(table, dt, horizon):
+        return table is not None and table[0] <= dt and dt + datetime.timedelta(minutes=horizon) <= table[1]
+
+    # Start building the table for the given point in time in a background thread
+    # dt: point in time (UTC)
+    def __build_background(self, dt):
+        with self.__lock:
+            if self.__building:
+                return
+            self.__building = True
+        thread = threading.Thread(target=self.__build_next, args=(dt,), name="AutoBlind sun table")
+        thread.daemon = True
+        thread.start()
+
+    # Build the table for the given point in time and replace the current table (executed in background thread)
+    # dt: point in time (UTC)
+    def __build_next(self, dt):
+        try:
+            table = self.__build(dt)
+            with self.__lock:
+                if self.__table is None or self.__table[0] < table[0]:
+                    self.__table = table
+                    self.__build_count += 1
+        except Exception as ex:
+            self.logger.exception("Building sun table failed: {0}".format(str(ex)))
+        finally:
+            self.__building = False
+
+    # Build table for two days starting at the full hour of the given point in time
+    # dt: point in time (UTC)
+    # returns: table (tuple start, end, azimuts, altitudes)
+    def __build(self, dt):
+        start = dt.replace(minute=0, second=0, microsecond=0)
+        count = 2 * 1440 // self.__resolution + 1
+        # sh.sun.pos expects an offset in real minutes
+        offset = (start - self.__sh.now().astimezone(datetime.timezone.utc)).total_seconds() / 60
+        azimuts = []
+        altitudes = []
+        for sample in range(count):
+            azimut, altitude = self.__sh.sun.pos(offset + sample * self.__resolution)
+            azimuts.append(math.degrees(float(azimut)))
+            altitudes.append(math.degrees(float(altitude)))
+        end = start + datetime.timedelta(minutes=(count - 1) * self.__resolution)
+        return start, end, tuple(azimuts), tuple(altitudes)
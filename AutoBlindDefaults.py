@@ -31,8 +31,41 @@ laststate_name_suspended = "Ausgesetzt bis %X"
 
 plugin_identification = "AutoBlind Plugin"
 
+compile_conditions = True
+
+startup_threads = 4
+
+update_batch_window = 0.05
+
+update_threads = 1
+
+sun_cache_time = 30
+
+sun_table = True
+
+byattr_chunk_size = 0
+
+byattr_chunk_interval = 1
+
+run_threads = 2
+
+run_queue_limit = 100
+
+run_timeout = 60
+
 
 def write_to_log():
     logger = logging.getLogger(__name__)
     logger.info("AutoBlind default startup delay = {0}".format(startup_delay))
     logger.info("AutoBlind default suspension time = {0}".format(suspend_time))
+    logger.info("AutoBlind compile conditions = {0}".format(compile_conditions))
+    logger.info("AutoBlind startup threads = {0}".format(startup_threads))
+    logger.info("AutoBlind update batch window = {0}".format(update_batch_window))
+    logger.info("AutoBlind update threads = {0}".format(update_threads))
+    logger.info("AutoBlind sun position cache time = {0}".format(sun_cache_time))
+    logger.info("AutoBlind sun position table = {0}".format(sun_table))
+    logger.info("AutoBlind byattr chunk size = {0}".format(byattr_chunk_size))
+    logger.info("AutoBlind byattr chunk interval = {0}".format(byattr_chunk_interval))
+    logger.info("AutoBlind run threads = {0}".format(run_threads))
+    logger.info("AutoBlind run queue limit = {0}".format(run_queue_limit))
+    logger.info("AutoBlind run timeout = {0}".format(run_timeout))
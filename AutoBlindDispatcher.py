@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# vim: set encoding=utf-8 tabstop=4 softtabstop=4 shiftwidth=4 expandtab
+#########################################################################
+#  Copyright 2014-     Thomas Ernst                       offline@gmx.net
+#########################################################################
+#  Finite state machine plugin for SmartHomeNG
+#
+#  This plugin is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This plugin is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this plugin. If not, see <http://www.gnu.org/licenses/>.
+#########################################################################
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from . import AutoBlindCurrent
+
+# Static dispatcher object (None: updates are not batched)
+dispatcher = None
+""":type : AbUpdateDispatcher"""
+
+
+# Init dispatcher
+# window: time (seconds) to collect updates before running them as batch (0: no batching)
+# threads: number of threads for running the updates of a batch
+def init(window, threads):
+    global dispatcher
+    if dispatcher is not None:
+        dispatcher.stop()
+    dispatcher = AbUpdateDispatcher(window, threads) if window > 0 else None
+
+
+# Stop dispatcher
+def stop():
+    global dispatcher
+    if dispatcher is not None:
+        dispatcher.stop()
+        dispatcher = None
+
+
+# Request an update of an AbItem. The update is run as part of a batch if batching is active, otherwise immediately
+# abitem: AbItem to update
+# item: item that triggered the update
+# caller: Caller that triggered the update
+# source: Source that triggered the update
+# dest: Destination of the update
+def dispatch(abitem, item, caller=None, source=None, dest=None):
+    if dispatcher is None:
+        abitem.update_state(item, caller, source, dest)
+    else:
+        dispatcher.add(abitem, item, caller, source, dest)
+
+
+# Class collecting updates of AbItems arriving within a short time window and running them as one batch. The current
+# conditions (time, sun position, ...) are determined only once per batch
+class AbUpdateDispatcher:
+    # Constructor
+    # window: time (seconds) to collect updates before running them as batch
+    # threads: number of threads for running the updates of a batch
+    def __init__(self, window, threads):
+        self.logger = logging.getLogger(__name__)
+        self.__window = window
+        self.__lock = threading.Lock()
+        self.__batch_lock = threading.Lock()
+        self.__pending = {}
+        self.__timer = None
+        self.__batch_start = None
+        self.__executor = ThreadPoolExecutor(max_workers=threads) if threads > 1 else None
+
+    # Add an update to the current batch. Starts a new batch if required
+    # abitem: AbItem to update
+    # item: item that triggered the update
+    # caller: Caller that triggered the update
+    # source: Source that triggered the update
+    # dest: Destination of the update
+    def add(self, abitem, item, caller, source, dest):
+        with self.__lock:
+            self.__pending.setdefault(abitem, []).append((item, caller, source, dest))
+            if self.__timer is None:
+                self.__batch_start = time.perf_counter()
+                self.__timer = threading.Timer(self.__window, self.__run_batch)
+                self.__timer.daemon = True
+                self.__timer.start()
+
+    # Stop dispatcher. Updates not yet run are discarded
+    def stop(self):
+        with self.__lock:
+            if self.__timer is not None:
+                self.__timer.cancel()
+                self.__timer = None
+            self.__pending = {}
+        if self.__executor is not None:
+            self.__executor.shutdown(wait=False)
+
+    # Run all collected updates. Batches are run one after the other: a batch started while the previous one is still
+    # running waits and then takes all updates collected in the meantime. So the current conditions held for one batch
+    # are not updated or released by another batch
+    def __run_batch(self):
+        with self.__batch_lock:
+            self.__run_pending()
+
+    # Run the updates collected so far
+    def __run_pending(self):
+        with self.__lock:
+            pending = self.__pending
+            batch_start = self.__batch_start
+            self.__pending = {}
+            self.__timer = None
+        if len(pending) == 0:
+            return
+
+        run_start = time.perf_counter()
+        AutoBlindCurrent.update()
+        AutoBlindCurrent.hold(True)
+        try:
+            if self.__executor is None:
+                for abitem, triggers in pending.items():
+                    self.__run_item(abitem, triggers)
+            else:
+                futures = [self.__executor.submit(self.__run_item, abitem, triggers)
+                           for abitem, triggers in pending.items()]
+                for future in futures:
+                    future.result()
+        finally:
+            AutoBlindCurrent.hold(False)
+
+        run_end = time.perf_counter()
+        text = "Batch of {0} item updates ({1} triggers): waited {2:.1f} ms, ran {3:.1f} ms"
+        count = sum(len(triggers) for triggers in pending.values())
+        self.logger.debug(text.format(len(pending), count, (run_start - batch_start) * 1000,
+                                      (run_end - run_start) * 1000))
+
+    # Run update of a single AbItem. If there have been multiple triggers for the AbItem, only the last one not caused
+    # by the plugin itself causes an update (changes caused by the plugin are ignored by the update). The other
+    # triggers only drop cached results
+    # abitem: AbItem to update
+    # triggers: list of triggers (item, caller, source, dest)
+    def __run_item(self, abitem, triggers):
+        try:
+            selected = len(triggers) - 1
+            for index in range(len(triggers) - 1, -1, -1):
+                item, caller, source, dest = triggers[index]
+                if not abitem.is_own_change(caller, source, item):
+                    selected = index
+                    break
+            for index, (item, caller, source, dest) in enumerate(triggers):
+                if index != selected:
+                    abitem.invalidate_cached_results(caller, source)
+            item, caller, source, dest = triggers[selected]
+            abitem.update_state(item, caller, source, dest)
+        except Exception as ex:
+            self.logger.exception("Update of item {0} failed: {1}".format(abitem.id, str(ex)))
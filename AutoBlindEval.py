@@ -20,6 +20,7 @@
 #########################################################################
 from . import AutoBlindTools
 from . import AutoBlindCurrent
+from . import AutoBlindDefaults
 from random import randint
 import subprocess
 import datetime
@@ -52,12 +53,14 @@ class AbEval(AutoBlindTools.AbItemChild):
         self._log_debug("Executing method 'GetRandomInt({0},{1})'", min_value, max_value)
         return randint(min_value, max_value)
 
-    # Execute a command
+    # Execute a command. The command is killed if it does not finish within run_timeout seconds
     # command: command to execute
     def execute(self, command):
         self._log_debug("Executing method 'execute({0})'", command)
         try:
-            return subprocess.call(command, shell=True)
+            return subprocess.call(command, shell=True, timeout=AutoBlindDefaults.run_timeout)
+        except subprocess.TimeoutExpired:
+            self._log_warning("Command '{0}' killed after {1} seconds", command, AutoBlindDefaults.run_timeout)
         except Exception as ex:
             self._log_exception(ex)
 
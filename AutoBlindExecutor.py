@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# vim: set encoding=utf-8 tabstop=4 softtabstop=4 shiftwidth=4 expandtab
+#########################################################################
+#  Copyright 2014-     Thomas Ernst                       offline@gmx.net
+#########################################################################
+#  Finite state machine plugin for SmartHomeNG
+#
+#  This plugin is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This plugin is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this plugin. If not, see <http://www.gnu.org/licenses/>.
+#########################################################################
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Static executor object (None: jobs are run immediately in the calling thread)
+executor = None
+""":type : AbRunExecutor"""
+
+
+# Init executor
+# threads: number of worker threads (0: run jobs immediately in the calling thread)
+# queue_limit: maximum number of jobs waiting or running. Further jobs are rejected
+# timeout: time (seconds) after which a job is reported as hanging
+def init(threads, queue_limit, timeout):
+    global executor
+    stop()
+    executor = AbRunExecutor(threads, queue_limit, timeout) if threads > 0 else None
+
+
+# Stop executor. Jobs not yet started are discarded
+def stop():
+    global executor
+    if executor is not None:
+        executor.stop()
+        executor = None
+
+
+# Run a job for an AbItem. The job is queued if the executor is active, otherwise it is run immediately
+# context: run context of the AbItem the job belongs to (see AbItem.get_run_context)
+# name: name of job for logging
+# func: function to call
+# args: arguments for func
+def submit(context, name, func, *args):
+    if executor is None:
+        func(*args)
+    else:
+        executor.submit(context, name, func, *args)
+
+
+# Class running jobs (run actions) in a bounded pool of worker threads, so slow jobs do not block the update of the
+# AbItem. Jobs of the same AbItem are run one after another in the order they have been submitted, jobs of different
+# AbItems run in parallel. Jobs get the run context of the AbItem (own variables and logger) instead of the AbItem, as
+# they run while the AbItem may already be updated again
+class AbRunExecutor:
+    # Constructor
+    # threads: number of worker threads
+    # queue_limit: maximum number of jobs waiting or running. Further jobs are rejected
+    # timeout: time (seconds) after which a running job is reported as hanging
+    def __init__(self, threads, queue_limit, timeout):
+        self.logger = logging.getLogger(__name__)
+        self.__queue_limit = queue_limit
+        self.__timeout = timeout
+        self.__lock = threading.Lock()
+        self.__condition = threading.Condition(self.__lock)
+        self.__queues = {}
+        # running jobs (key: id of AbItem, value: tuple (deadline or None if reported, context, name))
+        self.__running = {}
+        self.__count = 0
+        self.__stopped = False
+        self.__pool = ThreadPoolExecutor(max_workers=threads)
+        self.__monitor = threading.Thread(target=self.__monitor_jobs, name="AutoBlind run monitor")
+        self.__monitor.daemon = True
+        self.__monitor.start()
+
+    # Queue a job
+    # context: run context of the AbItem the job belongs to
+    # name: name of job for logging
+    # func: function to call
+    # args: arguments for func
+    def submit(self, context, name, func, *args):
+        with self.__lock:
+            if self.__stopped:
+                return
+            if self.__count >= self.__queue_limit:
+                text = "{0}: Not executed because {1} jobs are already waiting or running"
+                context.logger.warning(text, name, self.__count)
+                return
+            self.__count += 1
+            queue = self.__queues.get(context.id)
+            if queue is None:
+                queue = deque()
+                self.__queues[context.id] = queue
+                self.__pool.submit(self.__run_queue, context.id, queue)
+            queue.append((context, name, func, args))
+
+    # Return number of jobs waiting or running
+    def count(self):
+        return self.__count
+
+    # Stop executor. Running jobs can not be stopped, all jobs not yet started are discarded
+    def stop(self):
+        with self.__lock:
+            self.__stopped = True
+            self.__condition.notify()
+        self.__pool.shutdown(wait=False)
+
+    # Run the jobs of an AbItem until its queue is empty (executed in worker thread)
+    # abitem_id: id of AbItem the jobs belong to
+    # queue: queue of jobs of the AbItem
+    def __run_queue(self, abitem_id, queue):
+        while True:
+            with self.__lock:
+                if self.__stopped:
+                    self.__count -= len(queue)
+                    queue.clear()
+                    self.__queues.pop(abitem_id, None)
+                    return
+                context, name, func, args = queue[0]
+                self.__running[abitem_id] = (time.monotonic() + self.__timeout, context, name)
+                self.__condition.notify()
+            start = time.monotonic()
+            try:
+                func(*args)
+            except Exception as ex:
+                self.logger.exception("{0} of item {1} failed: {2}".format(name, abitem_id, str(ex)))
+            duration = time.monotonic() - start
+            if duration > self.__timeout:
+                context.logger.warning("{0}: Finished after {1:.1f} seconds", name, duration)
+            else:
+                context.logger.debug("{0}: Finished after {1:.3f} seconds", name, duration)
+            with self.__lock:
+                del self.__running[abitem_id]
+                queue.popleft()
+                self.__count -= 1
+                if len(queue) == 0:
+                    self.__queues.pop(abitem_id, None)
+                    return
+
+    # Report jobs running longer than the timeout while they are still running (executed in monitor thread). Waits
+    # until the next deadline of a running job or until a job is started
+    def __monitor_jobs(self):
+        with self.__condition:
+            while not self.__stopped:
+                now = time.monotonic()
+                wait = None
+                for abitem_id, (deadline, context, name) in list(self.__running.items()):
+                    if deadline is None:
+                        continue
+                    if deadline <= now:
+                        context.logger.warning("{0}: Still running after {1} seconds", name, self.__timeout)
+                        self.__running[abitem_id] = (None, context, name)
+                    elif wait is None or deadline - now < wait:
+                        wait = deadline - now
+                self.__condition.wait(wait)
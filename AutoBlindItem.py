@@ -20,12 +20,15 @@
 #########################################################################
 import time
 import datetime
+import threading
 from . import AutoBlindTools
 from .AutoBlindLogger import AbLogger
 from . import AutoBlindState
 from . import AutoBlindDefaults
 from . import AutoBlindCurrent
+from . import AutoBlindDispatcher
 from . import AutoBlindValue
+from . import AutoBlindAction
 
 
 # Class representing a blind item
@@ -92,6 +95,9 @@ class AbItem:
         self.__laststate_internal_name = "" if self.__laststate_item_name is None else self.__laststate_item_name()
 
         self.__states = []
+        self.__state_index = {}
+        self.__state_positions = {}
+        self.__enter_candidates = []
         self.__delay = 0
         self.__can_not_leave_current_state_since = 0
         self.__repeat_actions = AutoBlindValue.AbValue(self, "Repeat actions if state is not changed", False, "bool")
@@ -102,9 +108,26 @@ class AbItem:
         self.__update_trigger_source = None
         self.__update_trigger_dest = None
         self.__update_in_progress = False
+        self.__update_lock = threading.Lock()
+        self.__update_pending = None
+        self.__update_pending_invalidations = []
         self.__update_original_item = None
         self.__update_original_caller = None
         self.__update_original_source = None
+        self.__snapshot_items = None
+        self.__snapshot_evals = None
+
+        # Index of condition sets with cached results (key: id of item the condition sets depend on)
+        self.__dependency_index = {}
+        self.__dependency_trigger_items = set()
+
+        # Fixed limits of time- and sun-based conditions for predicting the next required update
+        self.__wakeup_times = set()
+        self.__wakeup_azimuts = set()
+        self.__wakeup_altitudes = set()
+        self.__wakeup_daily = False
+        self.__wakeup_monthly = False
+        self.__wakeup_next = None
 
         # Check item configuration
         self.__check_item_config()
@@ -117,19 +140,40 @@ class AbItem:
             "current.state_name": ""
         }
 
-        # initialize states
-        for item_state in self.__item.return_children():
+        # initialize states. The position of each state is known in advance, so that conditions can refer to it
+        item_states = self.__item.return_children()
+        for position, item_state in enumerate(item_states):
+            self.__state_positions[item_state.id()] = position
+        for position, item_state in enumerate(item_states):
             try:
-                self.__states.append(AutoBlindState.AbState(self, item_state))
+                state = AutoBlindState.AbState(self, item_state, position)
+                self.__states.append(state)
+                self.__state_index[state.id] = state
             except ValueError as ex:
                 self.__logger.error("Ignoring state {0} because:  {1}".format(item_state.id(), str(ex)))
 
         if len(self.__states) == 0:
             raise ValueError("{0}: No states defined!".format(self.id))
 
+        # states behind the first state that can always be entered will never be entered
+        for state in self.__states:
+            self.__enter_candidates.append(state)
+            if state.can_always_enter():
+                break
+
+        # build index of condition sets depending on trigger items
+        self.__dependency_index_build()
+
+        # collect limits of time- and sun-based conditions
+        self.__wakeup_init()
+
         # Write settings to log
-        self.__write_to_log()
+        if self.__logger.enabled:
+            self.__write_to_log()
 
+    # Start the item: start timer with startup-delay or run first update. Items may be initialized in parallel, so
+    # this has to be called after all items have been initialized
+    def startup(self):
         # start timer with startup-delay
         startup_delay = 0 if self.__startup_delay.is_empty() else self.__startup_delay.get()
         if startup_delay > 0:
@@ -147,26 +191,64 @@ class AbItem:
     # caller: Caller that triggered the update
     # noinspection PyCallingNonCallable,PyUnusedLocal
     def update_state(self, item, caller=None, source=None, dest=None):
-        if self.__update_in_progress or not self.__startup_delay_over:
+        self.__dependency_index_invalidate(caller, source)
+        if not self.__startup_delay_over:
             return
 
-        self.__update_in_progress = True
+        with self.__update_lock:
+            if self.__update_in_progress:
+                # Another update is running: remember trigger for one follow-up update. Changes caused by this
+                # plugin would be ignored anyway, so they do not replace a trigger already waiting
+                if self.__update_pending is None or not self.is_own_change(caller, source, item):
+                    self.__update_pending = (item, caller, source, dest)
+                self.__update_pending_invalidations.append((caller, source))
+                return
+            self.__update_in_progress = True
+
+        try:
+            while True:
+                self.__update_state_run(item, caller, source, dest)
+                with self.__update_lock:
+                    if self.__update_pending is None:
+                        self.__update_in_progress = False
+                        return
+                    item, caller, source, dest = self.__update_pending
+                    invalidations = self.__update_pending_invalidations
+                    self.__update_pending = None
+                    self.__update_pending_invalidations = []
+                # results cached by the previous update may be based on values from before these triggers
+                for invalidate_caller, invalidate_source in invalidations:
+                    self.__dependency_index_invalidate(invalidate_caller, invalidate_source)
+                self.__logger.debug("Running follow-up update for triggers received during previous update")
+        except Exception:
+            with self.__update_lock:
+                self.__update_in_progress = False
+                self.__update_pending = None
+                self.__update_pending_invalidations = []
+            raise
 
-        self.__logger.update_logfile()
-        self.__logger.header("Update state of item {0}".format(self.__name))
-        if caller:
-            item_id = item.id() if item is not None else "(no item)"
-            self.__logger.debug("Update triggered by {0} (item={1} source={2} dest={3})", caller, item_id, source, dest)
+    # Find the state, matching the current conditions and perform the actions of this state (one single update)
+    # item: item that triggered the update
+    # caller: Caller that triggered the update
+    # source: Source that triggered the update
+    # dest: Destination of the update
+    # noinspection PyCallingNonCallable,PyUnusedLocal
+    def __update_state_run(self, item, caller, source, dest):
+        if self.__logger.enabled:
+            self.__logger.header("Update state of item {0}".format(self.__name))
+            if caller:
+                item_id = item.id() if item is not None else "(no item)"
+                text = "Update triggered by {0} (item={1} source={2} dest={3})"
+                self.__logger.debug(text, caller, item_id, source, dest)
 
         # Find out what initially caused the update to trigger if the caller is "Eval"
         orig_caller, orig_source, orig_item = AutoBlindTools.get_original_caller(self.sh, caller, source, item)
-        if orig_caller != caller:
+        if orig_caller != caller and self.__logger.enabled:
             text = "Eval initially triggered by {0} (item={1} source={2})"
             self.__logger.debug(text, orig_caller, orig_item.id(), orig_source)
 
         if orig_caller == AutoBlindDefaults.plugin_identification or caller == AutoBlindDefaults.plugin_identification:
             self.__logger.debug("Ignoring changes from {0}", AutoBlindDefaults.plugin_identification)
-            self.__update_in_progress = False
             return
 
         self.__update_trigger_item = item.id()
@@ -181,7 +263,6 @@ class AbItem:
         if self.__lock_is_active():
             self.__logger.info("AutoBlind is locked")
             self.__laststate_internal_name = AutoBlindDefaults.laststate_name_manually_locked
-            self.__update_in_progress = False
             return
 
         # check if suspended
@@ -191,7 +272,6 @@ class AbItem:
             text = "AutoBlind has been suspended after manual changes. Reactivating at {0}"
             self.__logger.info(text, active_timer_time)
             self.__laststate_internal_name = active_timer_time.strftime(AutoBlindDefaults.laststate_name_suspended)
-            self.__update_in_progress = False
             return
 
         # Update current values
@@ -199,54 +279,67 @@ class AbItem:
         self.__variables["item.suspend_time"] = self.__suspend_time.get()
         self.__variables["item.suspend_remaining"] = -1
 
-        # get last state
-        last_state = self.__laststate_get()
-        if last_state is not None:
-            self.__logger.info("Last state: {0} ('{1}')", last_state.id, last_state.name)
-        if self.__can_not_leave_current_state_since == 0:
-            self.__delay = 0
-        else:
-            self.__delay = time.time() - self.__can_not_leave_current_state_since
-
-        # check if current state can be left
-        if last_state is not None and not self.__update_check_can_leave(last_state):
-            self.__logger.info("Can not leave current state, staying at {0} ('{1}')", last_state.id, last_state.name)
-            can_leave_state = False
-            new_state = last_state
+        # read every item/eval only once while checking the states
+        self.__snapshot_start()
+        try:
+            # get last state
+            last_state = self.__laststate_get()
+            if last_state is not None:
+                self.__logger.info("Last state: {0} ('{1}')", last_state.id, last_state.name)
             if self.__can_not_leave_current_state_since == 0:
-                self.__can_not_leave_current_state_since = time.time()
-        else:
-            can_leave_state = True
-            new_state = None
-
-        if can_leave_state:
-            # find new state
-            for state in self.__states:
-                if self.__update_check_can_enter(state):
-                    new_state = state
+                self.__delay = 0
+            else:
+                self.__delay = time.time() - self.__can_not_leave_current_state_since
+
+            # check if current state can be left
+            if last_state is not None and not self.__update_check_can_leave(last_state):
+                self.__logger.info("Can not leave current state, staying at {0} ('{1}')", last_state.id,
+                                   last_state.name)
+                can_leave_state = False
+                new_state = last_state
+                if self.__can_not_leave_current_state_since == 0:
+                    self.__can_not_leave_current_state_since = time.time()
+            else:
+                can_leave_state = True
+                new_state = None
+
+            if can_leave_state:
+                # find new state
+                for state in self.__enter_candidates:
+                    if self.__update_check_can_enter(state):
+                        new_state = state
+                        self.__can_not_leave_current_state_since = 0
+                        break
+            else:
+                # if current state can not be left, check if enter conditions are still valid.
+                # If yes, set "can_not_leave_current_state_since" to 0
+                if new_state.can_enter():
                     self.__can_not_leave_current_state_since = 0
-                    break
-
-            # no new state -> leave
-            if new_state is None:
-                if last_state is None:
-                    self.__logger.info("No matching state found, no previous state available. Doing nothing.")
-                else:
-                    text = "No matching state found, staying at {0} ('{1}')"
-                    self.__logger.info(text, last_state.id, last_state.name)
-                    last_state.run_stay(self.__repeat_actions.get())
-                self.__update_in_progress = False
-                return
-        else:
-            # if current state can not be left, check if enter conditions are still valid.
-            # If yes, set "can_not_leave_current_state_since" to 0
-            if new_state.can_enter():
-                self.__can_not_leave_current_state_since = 0
+        finally:
+            # actions may change items, so from now on items/evals are read directly again. This must also happen
+            # if checking the states fails, otherwise later reads would still see the values of this update
+            self.__snapshot_end()
+
+        # no new state -> leave
+        if new_state is None:
+            if last_state is None:
+                self.__logger.info("No matching state found, no previous state available. Doing nothing.")
+            else:
+                text = "No matching state found, staying at {0} ('{1}')"
+                self.__logger.info(text, last_state.id, last_state.name)
+                write_plan = AutoBlindAction.AbWritePlan(self)
+                last_state.run_stay(self.__repeat_actions.get(), write_plan)
+                write_plan.close()
+            return
+
+        # immediate item writes of all actions of this update are collected and executed together
+        write_plan = AutoBlindAction.AbWritePlan(self)
 
         # get data for new state
         if last_state is not None and new_state.id == last_state.id:
             self.__logger.info("Staying at {0} ('{1}')", new_state.id, new_state.name)
-            new_state.run_stay(self.__repeat_actions.get())
+            new_state.run_stay(self.__repeat_actions.get(), write_plan)
+            write_plan.close()
 
             # New state is last state
             if self.__laststate_internal_name != new_state.name:
@@ -256,14 +349,34 @@ class AbItem:
             # New state is different from last state
             if last_state is not None:
                 self.__logger.info("Leaving {0} ('{1}')", last_state.id, last_state.name)
-                last_state.run_leave(self.__repeat_actions.get())
+                last_state.run_leave(self.__repeat_actions.get(), write_plan)
 
             self.__logger.info("Entering {0} ('{1}')", new_state.id, new_state.name)
-            new_state.run_enter(self.__repeat_actions.get())
+            new_state.run_enter(self.__repeat_actions.get(), write_plan)
+            write_plan.close()
 
             self.__laststate_set(new_state)
 
-        self.__update_in_progress = False
+    # Drop cached results of condition sets affected by a trigger without running an update
+    # caller: Caller of the trigger
+    # source: Source of the trigger
+    def invalidate_cached_results(self, caller, source):
+        self.__dependency_index_invalidate(caller, source)
+
+    # callback function for item triggers: update is run by the dispatcher (possibly batched with other updates)
+    # noinspection PyUnusedLocal
+    def __dispatch_update(self, item, caller=None, source=None, dest=None):
+        AutoBlindDispatcher.dispatch(self, item, caller, source, dest)
+
+    # check if a change has been caused by this plugin (directly or via eval)
+    # caller: Caller that triggered the update
+    # source: Source that triggered the update
+    # item: item that triggered the update
+    def is_own_change(self, caller, source, item):
+        if caller == AutoBlindDefaults.plugin_identification:
+            return True
+        orig_caller, __, __ = AutoBlindTools.get_original_caller(self.sh, caller, source, item)
+        return orig_caller == AutoBlindDefaults.plugin_identification
 
     # check if state can be left after setting state-specific variables
     # state: state to check
@@ -287,6 +400,154 @@ class AbItem:
             self.__variables["current.state_id"] = ""
             self.__variables["current.state_name"] = ""
 
+    # region Dependency index ******************************************************************************************
+    # Build index of condition sets whose result can be cached between updates.
+    # The result of a condition set can be cached if it depends on item values only and all of these items are
+    # triggering an update of the AbItem when changed. The cached result is dropped when one of these items triggers.
+    def __dependency_index_build(self):
+        self.__dependency_index = {}
+        self.__dependency_trigger_items = set()
+        # noinspection PyProtectedMember
+        if self.__item._eval_trigger:
+            # noinspection PyProtectedMember
+            for entry in self.__item._eval_trigger:
+                for item in self.__sh.match_items(entry):
+                    self.__dependency_trigger_items.add(item.id())
+
+        for state in self.__states:
+            for condition_set in state.get_condition_sets():
+                dependencies = condition_set.dependencies
+                if dependencies is None or not dependencies.issubset(self.__dependency_trigger_items):
+                    continue
+                condition_set.enable_cache()
+                for item_id in dependencies:
+                    self.__dependency_index.setdefault(item_id, []).append(condition_set)
+
+    # Drop cached results of condition sets affected by an update
+    # caller: Caller that triggered the update
+    # source: Source that triggered the update
+    def __dependency_index_invalidate(self, caller, source):
+        if caller == "Eval" and source in self.__dependency_trigger_items:
+            # update triggered by change of a trigger item: only condition sets depending on this item are affected
+            for condition_set in self.__dependency_index.get(source, ()):
+                condition_set.invalidate_cache()
+        else:
+            # update triggered by something else (cycle, cron, ...): we do not know what changed
+            for condition_sets in self.__dependency_index.values():
+                for condition_set in condition_sets:
+                    condition_set.invalidate_cache()
+
+    # endregion
+
+    # region Wakeup ****************************************************************************************************
+    # Collect fixed limits of all conditions based on time, date or sun position
+    def __wakeup_init(self):
+        for state in self.__states:
+            for condition_set in state.get_condition_sets():
+                for condition in condition_set.conditions.values():
+                    limits = condition.get_wakeup_limits()
+                    if limits is None:
+                        continue
+                    name, values = limits
+                    if name == "time":
+                        self.__wakeup_times.update(values)
+                    elif name == "sun_azimut":
+                        self.__wakeup_azimuts.update(values)
+                    elif name == "sun_altitude":
+                        self.__wakeup_altitudes.update(values)
+                    elif name == "weekday":
+                        self.__wakeup_daily = True
+                    elif name == "month":
+                        self.__wakeup_monthly = True
+
+    # Determine the next point in time at which one of the time/date/sun limits is crossed and schedule an update
+    # for this point in time. As the limits are fixed, nothing needs to be done while a wakeup is pending.
+    def __wakeup_schedule(self):
+        now = self.__sh.now()
+        if self.__wakeup_next is not None and self.__wakeup_next > now:
+            return
+
+        candidates = []
+        for limit in self.__wakeup_times:
+            candidate = now.replace(hour=limit.hour, minute=limit.minute, second=limit.second, microsecond=0)
+            if candidate <= now:
+                candidate += datetime.timedelta(days=1)
+            candidates.append(candidate)
+        if self.__wakeup_daily or self.__wakeup_monthly:
+            midnight = (now + datetime.timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+            if self.__wakeup_daily or midnight.day == 1:
+                candidates.append(midnight)
+            else:
+                year, month = (now.year + 1, 1) if now.month == 12 else (now.year, now.month + 1)
+                candidates.append(midnight.replace(year=year, month=month, day=1))
+        horizon = 1440
+        if len(candidates) > 0:
+            horizon = min(horizon, int((min(candidates) - now).total_seconds() / 60) + 1)
+        sun_crossing = AutoBlindCurrent.values.get_next_sun_crossing(self.__wakeup_azimuts, self.__wakeup_altitudes,
+                                                                     horizon)
+        if sun_crossing is not None:
+            candidates.append(sun_crossing)
+        elif len(self.__wakeup_azimuts) > 0 or len(self.__wakeup_altitudes) > 0:
+            # no sun limit crossed within the horizon (e.g. polar day): check again at the end of the horizon
+            candidates.append(now + datetime.timedelta(minutes=horizon))
+
+        if len(candidates) == 0:
+            self.__wakeup_next = None
+            return
+
+        # wake up one second after the limit has been crossed
+        self.__wakeup_next = min(candidates) + datetime.timedelta(seconds=1)
+        self.__logger.debug("Next wakeup for time/sun conditions at {0}", self.__wakeup_next)
+        name = self.id + "-Wakeup"
+        value = {"item": self.__item, "caller": "Wakeup"}
+        self.__sh.scheduler.remove(name)
+        self.__sh.scheduler.add(name, self.__wakeup_callback, value=value, next=self.__wakeup_next)
+
+    # callback function that is called when a time/date/sun limit has been crossed
+    # noinspection PyUnusedLocal
+    def __wakeup_callback(self, item, caller=None, source=None, dest=None):
+        self.__wakeup_next = None
+        AutoBlindDispatcher.dispatch(self, item, caller, source, dest)
+        self.__wakeup_schedule()
+
+    # endregion
+
+    # region Snapshot **************************************************************************************************
+    # Start snapshot: from now on, each item and eval is read only once and the value is reused afterwards
+    def __snapshot_start(self):
+        self.__snapshot_items = {}
+        self.__snapshot_evals = {}
+
+    # End snapshot: drop all remembered values
+    def __snapshot_end(self):
+        self.__snapshot_items = None
+        self.__snapshot_evals = None
+
+    # Return value of an item. While a snapshot is active, each item is read only once
+    # item: item to read
+    def get_item_value(self, item):
+        snapshot = self.__snapshot_items
+        if snapshot is None:
+            return item()
+        item_id = item.id()
+        if item_id not in snapshot:
+            snapshot[item_id] = item()
+        return snapshot[item_id]
+
+    # Return result of an eval expression. While a snapshot is active, each expression is evaluated only once.
+    # Expressions using 'autoblind_eval' are always evaluated as they might depend on the state being checked
+    # source: source text of eval expression
+    # evaluate: function evaluating the expression
+    def get_eval_value(self, source, evaluate):
+        snapshot = self.__snapshot_evals
+        if snapshot is None or "autoblind_eval" in source:
+            return evaluate()
+        if source not in snapshot:
+            snapshot[source] = evaluate()
+        return snapshot[source]
+
+    # endregion
+
     # region Laststate *************************************************************************************************
     # Set laststate
     # new_state: new state to be used as laststate
@@ -304,10 +565,7 @@ class AbItem:
     # get last state object based on laststate_id
     # returns: AbState instance of last state or "None" if no last state could be found
     def __laststate_get(self):
-        for state in self.__states:
-            if state.id == self.__laststate_internal_id:
-                return state
-        return None
+        return self.__state_index.get(self.__laststate_internal_id)
 
     # endregion
 
@@ -328,7 +586,6 @@ class AbItem:
         if caller == "AutoBlind":
             return
 
-        self.__logger.update_logfile()
         self.__logger.header("Item 'lock' changed")
         self.__logger.debug("'{0}' set to '{1}' by '{2}'", item.id(), item(), caller)
 
@@ -382,7 +639,6 @@ class AbItem:
     # callback function that is called when one of the items given at "watch_manual" is being changed
     # noinspection PyUnusedLocal
     def __suspend_watch_callback(self, item, caller=None, source=None, dest=None):
-        self.__logger.update_logfile()
         self.__logger.header("Watch suspend triggered")
         text = "Manual operation: Change of item '{0}' by '{1}' (source='{2}', dest='{3}')"
         self.__logger.debug(text, item.id(), caller, source, dest)
@@ -397,7 +653,6 @@ class AbItem:
 
     # callback function that is called when the suspend time is over
     def __suspend_reactivate_callback(self):
-        self.__logger.update_logfile()
         self.__logger.header("Suspend time over")
         self.__suspend_remove()
 
@@ -415,7 +670,10 @@ class AbItem:
             item.add_method_trigger(self.__suspend_watch_callback)
 
         # add item trigger
-        self.__item.add_method_trigger(self.update_state)
+        self.__item.add_method_trigger(self.__dispatch_update)
+
+        # add wakeup for time- and sun-based conditions
+        self.__wakeup_schedule()
 
     # Check item settings and update if required
     # noinspection PyProtectedMember
@@ -577,6 +835,16 @@ class AbItem:
     def get_laststate_id(self):
         return self.__laststate_internal_id
 
+    # return position of last state (-1 if there is no last state or the last state is unknown)
+    def get_laststate_position(self):
+        return self.__state_positions.get(self.__laststate_internal_id, -1)
+
+    # return position of a state
+    # state_id: id of state
+    # returns: position of state or None if there is no such state
+    def get_state_position(self, state_id):
+        return self.__state_positions.get(state_id)
+
     # return update trigger item
     def get_update_trigger_item(self):
         return self.__update_trigger_item
@@ -615,13 +883,17 @@ class AbItem:
             raise ValueError("Unknown variable '{0}!".format(varname))
         self.__variables[varname] = value
 
+    # Return a run context for running actions outside of the update, with a copy of the current variables
+    def get_run_context(self):
+        return AbItemRunContext(self, self.__item, dict(self.__variables))
+
     # endregion
 
     # callback function that is called after the startup delay
     # noinspection PyUnusedLocal
     def __startup_delay_callback(self, item, caller=None, source=None, dest=None):
         self.__startup_delay_over = True
-        self.update_state(item, "Startup Delay", source, dest)
+        AutoBlindDispatcher.dispatch(self, item, "Startup Delay", source, dest)
         self.__add_triggers()
 
     # Return an item related to the AutoBlind Object Item
@@ -672,3 +944,60 @@ class AbItem:
         if attribute not in self.__item.conf:
             return None
         return self.return_item(self.__item.conf[attribute])
+
+
+# Class representing an AbItem for actions running outside of the update (see AutoBlindExecutor). It has its own copy
+# of the variables and its own logger (with own indentation), and reads items and evals directly instead of using the
+# snapshot of the update, which may already belong to another update. Everything else is taken from the AbItem
+class AbItemRunContext:
+    # return item id
+    @property
+    def id(self):
+        return self.__abitem.id
+
+    # return instance of smarthome.py class
+    @property
+    def sh(self):
+        return self.__abitem.sh
+
+    # return instance of logger class
+    @property
+    def logger(self):
+        return self.__logger
+
+    # Constructor
+    # abitem: AbItem instance
+    # item: item of AbItem (for logger)
+    # variables: copy of variables of AbItem
+    def __init__(self, abitem, item, variables):
+        self.__abitem = abitem
+        self.__variables = variables
+        self.__logger = AbLogger.create(item)
+
+    # return value of variable
+    def get_variable(self, varname):
+        return self.__variables[varname] if varname in self.__variables else "(Unknown variable '{0}'!)".format(varname)
+
+    # set value of variable (only in this run context)
+    def set_variable(self, varname, value):
+        if varname not in self.__variables:
+            raise ValueError("Unknown variable '{0}!".format(varname))
+        self.__variables[varname] = value
+
+    # Return value of an item
+    # item: item to read
+    # noinspection PyMethodMayBeStatic
+    def get_item_value(self, item):
+        return item()
+
+    # Return result of an eval expression
+    # source: source text of eval expression
+    # evaluate: function evaluating the expression
+    # noinspection PyMethodMayBeStatic,PyUnusedLocal
+    def get_eval_value(self, source, evaluate):
+        return evaluate()
+
+    # Everything else is taken from the AbItem
+    def __getattr__(self, name):
+        return getattr(self.__abitem, name)
+
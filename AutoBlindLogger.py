@@ -21,6 +21,118 @@
 import logging
 import datetime
 import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+
+# Background writer for the extended log files. Log lines are queued by the AbLogger instances and written by a
+# separate thread which keeps the most recently used log files open and flushes them periodically.
+class AbLogWriter:
+    # Maximum number of log files kept open at the same time
+    max_open_files = 32
+
+    # Interval (seconds) for flushing open log files
+    flush_interval = 2.0
+
+    # Constructor
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self.__queue = queue.Queue()
+        self.__files = OrderedDict()
+        self.__date = None
+        self.__thread = threading.Thread(target=self.__run, name="AutoBlind LogWriter")
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    # Queue a log line for writing
+    # directory: directory for log file
+    # section: section of log file (part of file name)
+    # timestamp: timestamp of log line (date is part of file name)
+    # text: text to write
+    def write(self, directory, section, timestamp, text):
+        self.__queue.put((directory, section, timestamp, text))
+
+    # Write all queued log lines, close all files and stop writer thread
+    def stop(self):
+        self.__queue.put(None)
+        self.__thread.join()
+
+    # Main loop of writer thread
+    def __run(self):
+        next_flush = time.time() + AbLogWriter.flush_interval
+        running = True
+        while running:
+            try:
+                entry = self.__queue.get(timeout=AbLogWriter.flush_interval)
+            except queue.Empty:
+                entry = False
+
+            # write all entries currently waiting in queue
+            while entry is not False:
+                if entry is None:
+                    running = False
+                    break
+                self.__write_entry(*entry)
+                try:
+                    entry = self.__queue.get_nowait()
+                except queue.Empty:
+                    entry = False
+
+            if not running or time.time() >= next_flush:
+                self.__flush()
+                next_flush = time.time() + AbLogWriter.flush_interval
+
+        self.__close_all()
+
+    # Write a single log line to the log file
+    # directory: directory for log file
+    # section: section of log file (part of file name)
+    # timestamp: timestamp of log line (date is part of file name)
+    # text: text to write
+    def __write_entry(self, directory, section, timestamp, text):
+        date = str(timestamp.date())
+        if date != self.__date:
+            # new day: files of previous day are not needed any more
+            self.__close_all()
+            self.__date = date
+        filename = directory + date + '-' + section + ".log"
+        try:
+            self.__get_file(filename).write(text)
+        except Exception as ex:
+            self.logger.error("Can not write to log file '{0}': {1}".format(filename, str(ex)))
+
+    # Return file handle for given file name. Opens file if required and closes least recently used file if too
+    # many files are open
+    # filename: name of log file
+    def __get_file(self, filename):
+        if filename in self.__files:
+            self.__files.move_to_end(filename)
+            return self.__files[filename]
+        while len(self.__files) >= AbLogWriter.max_open_files:
+            __, file = self.__files.popitem(last=False)
+            file.close()
+        file = open(filename, mode="a", encoding="utf-8")
+        self.__files[filename] = file
+        return file
+
+    # Flush all open files
+    def __flush(self):
+        for filename in self.__files:
+            try:
+                self.__files[filename].flush()
+            except Exception as ex:
+                self.logger.error("Can not flush log file '{0}': {1}".format(filename, str(ex)))
+
+    # Close all open files
+    def __close_all(self):
+        while len(self.__files) > 0:
+            filename, file = self.__files.popitem(last=False)
+            try:
+                file.close()
+            except Exception as ex:
+                self.logger.error("Can not close log file '{0}': {1}".format(filename, str(ex)))
 
 
 class AbLogger:
@@ -33,6 +145,10 @@ class AbLogger:
     # Max age for log files (days)
     __logmaxage = 0
 
+    # Background writer for log files
+    __writer = None
+    __writer_lock = threading.Lock()
+
     # Set log level
     # loglevel: current loglevel
     @staticmethod
@@ -44,6 +160,11 @@ class AbLogger:
             logger = logging.getLogger('plugins.autoblind.AutoBlindLogger')
             logger.error("Das Log-Level muss numerisch angegeben werden.")
 
+    # Return log level
+    @staticmethod
+    def get_loglevel():
+        return AbLogger.__loglevel
+
     # Set log directory
     # logdirectory: Target directory for AutoBlind log files
     @staticmethod
@@ -61,6 +182,23 @@ class AbLogger:
             logger = logging.getLogger('plugins.autoblind.AutoBlindLogger')
             logger.error("Das maximale Alter der Logdateien muss numerisch angegeben werden.")
 
+    # Write all pending log lines and stop background writer
+    @staticmethod
+    def stop_writer():
+        with AbLogger.__writer_lock:
+            if AbLogger.__writer is not None:
+                AbLogger.__writer.stop()
+                AbLogger.__writer = None
+
+    # Return background writer, start writer if required
+    @staticmethod
+    def __get_writer():
+        if AbLogger.__writer is None:
+            with AbLogger.__writer_lock:
+                if AbLogger.__writer is None:
+                    AbLogger.__writer = AbLogWriter()
+        return AbLogger.__writer
+
     @staticmethod
     def remove_old_logfiles():
         if AbLogger.__logmaxage == 0:
@@ -87,26 +225,20 @@ class AbLogger:
 
     # Return AbLogger instance for given item
     # item: item for which the detailed log is
+    # Returns a dummy logger if extended logging is not active
     @staticmethod
     def create(item):
+        if AbLogger.__loglevel <= 0:
+            return AbLoggerDummy(item)
         return AbLogger(item)
 
     # Constructor
     # item: item for which the detailed log is (used as part of file name)
     def __init__(self, item):
         self.logger = logging.getLogger(__name__)
+        self.enabled = True
         self.__section = item.id().replace(".", "_").replace("/", "")
         self.__indentlevel = 0
-        self.__date = None
-        self.__filename = ""
-        self.update_logfile()
-
-    # Update name logfile if required
-    def update_logfile(self):
-        if self.__date == datetime.datetime.today() and self.__filename is not None:
-            return
-        self.__date = str(datetime.date.today())
-        self.__filename = str(AbLogger.__logdirectory + self.__date + '-' + self.__section + ".log")
 
     # Increase indentation level
     # by: number of levels to increase
@@ -129,9 +261,9 @@ class AbLogger:
         if level <= AbLogger.__loglevel:
             indent = "\t" * self.__indentlevel
             text = text.format(*args)
-            logtext = "{0}{1} {2}\r\n".format(datetime.datetime.now(), indent, text)
-            with open(self.__filename, mode="a", encoding="utf-8") as f:
-                f.write(logtext)
+            now = datetime.datetime.now()
+            logtext = "{0}{1} {2}\r\n".format(now, indent, text)
+            AbLogger.__get_writer().write(AbLogger.__logdirectory, self.__section, now, logtext)
 
     # log header line (as info)
     # text: header text
@@ -184,10 +316,7 @@ class AbLoggerDummy:
     # noinspection PyUnusedLocal
     def __init__(self, item=None):
         self.logger = logging.getLogger(__name__)
-
-    # Update name logfile if required
-    def update_logfile(self):
-        pass
+        self.enabled = False
 
     # Increase indentation level
     # by: number of levels to increase
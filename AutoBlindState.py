@@ -22,6 +22,7 @@ from . import AutoBlindTools
 from . import AutoBlindConditionSets
 from . import AutoBlindActions
 from . import AutoBlindValue
+from . import AutoBlindDefaults
 
 
 # Class representing an object state, consisting of name, conditions to be met and configured actions for state
@@ -41,13 +42,20 @@ class AbState(AutoBlindTools.AbItemChild):
     def text(self):
         return self.__text.get(self.__name)
 
+    # Return position of state within the states of the AbItem
+    @property
+    def position(self):
+        return self.__position
+
     # Constructor
     # abitem: parent AbItem instance
     # item_state: item containing configuration of state
-    def __init__(self, abitem, item_state):
+    # position: position of state within the states of the AbItem
+    def __init__(self, abitem, item_state, position):
         super().__init__(abitem)
         self.__item = item_state
         self.__id = self.__item.id()
+        self.__position = position
         self.__name = ""
         self.__text = AutoBlindValue.AbValue(self._abitem, "State Name", False, "str")
         self.__enterConditionSets = AutoBlindConditionSets.AbConditionSets(self._abitem)
@@ -63,9 +71,28 @@ class AbState(AutoBlindTools.AbItemChild):
         finally:
             self._log_decrease_indent()
 
+    # Return all condition sets (enter and leave) of the state
+    def get_condition_sets(self):
+        condition_sets = list(self.__enterConditionSets.condition_sets.values())
+        condition_sets.extend(self.__leaveConditionSets.condition_sets.values())
+        return condition_sets
+
+    # Check if the state can be entered without checking any conditions
+    # returns: True = no enter condition set or an enter condition set without conditions is defined
+    def can_always_enter(self):
+        if self.__enterConditionSets.count() == 0:
+            return True
+        for condition_set in self.__enterConditionSets.condition_sets.values():
+            if len(condition_set.conditions) == 0:
+                return True
+        return False
+
     # Check conditions if state can be entered
     # returns: True = At least one enter condition set is fulfulled, False = No enter condition set is fulfilled
     def can_enter(self):
+        if not self._log_enabled:
+            return self.__enterConditionSets.one_conditionset_matching()
+
         self._log_info("Check if state '{0}' ('{1}') can be entered:", self.id, self.name)
         self._log_increase_indent()
         result = self.__enterConditionSets.one_conditionset_matching()
@@ -79,6 +106,9 @@ class AbState(AutoBlindTools.AbItemChild):
     # Check conditions if state can be left
     # returns: True = At least one leave condition set is fulfulled, False = No leave condition set is fulfilled
     def can_leave(self):
+        if not self._log_enabled:
+            return self.__leaveConditionSets.one_conditionset_matching()
+
         self._log_info("Check if state '{0}' ('{1}') can be left:", self.id, self.name)
         self._log_increase_indent()
         result = self.__leaveConditionSets.one_conditionset_matching()
@@ -129,23 +159,26 @@ class AbState(AutoBlindTools.AbItemChild):
 
     # run actions when entering the state
     # item_allow_repeat: Is repeating actions generally allowed for the item?
-    def run_enter(self, allow_item_repeat: bool):
+    # write_plan: AbWritePlan-Instance collecting the immediate item writes of the update (None: write directly)
+    def run_enter(self, allow_item_repeat: bool, write_plan=None):
         self._log_increase_indent()
-        self.__actions_enter.execute(False, allow_item_repeat, self.__actions_enter_or_stay)
+        self.__actions_enter.execute(False, allow_item_repeat, self.__actions_enter_or_stay, write_plan)
         self._log_decrease_indent()
 
     # run actions when staying at the state
     # item_allow_repeat: Is repeating actions generally allowed for the item?
-    def run_stay(self, allow_item_repeat: bool):
+    # write_plan: AbWritePlan-Instance collecting the immediate item writes of the update (None: write directly)
+    def run_stay(self, allow_item_repeat: bool, write_plan=None):
         self._log_increase_indent()
-        self.__actions_stay.execute(True, allow_item_repeat, self.__actions_enter_or_stay)
+        self.__actions_stay.execute(True, allow_item_repeat, self.__actions_enter_or_stay, write_plan)
         self._log_decrease_indent()
 
     # run actions when leaving the state
     # item_allow_repeat: Is repeating actions generally allowed for the item?
-    def run_leave(self, allow_item_repeat: bool):
+    # write_plan: AbWritePlan-Instance collecting the immediate item writes of the update (None: write directly)
+    def run_leave(self, allow_item_repeat: bool, write_plan=None):
         self._log_increase_indent()
-        self.__actions_leave.execute(False, allow_item_repeat)
+        self.__actions_leave.execute(False, allow_item_repeat, None, write_plan)
         self._log_decrease_indent()
 
     # Read configuration from item and populate data in class
@@ -213,3 +246,8 @@ class AbState(AutoBlindTools.AbItemChild):
             self.__actions_stay.complete(item_state)
             self.__actions_enter_or_stay.complete(item_state)
             self.__actions_leave.complete(item_state)
+
+            # Generate specialized functions checking the condition sets
+            if AutoBlindDefaults.compile_conditions:
+                self.__enterConditionSets.compile()
+                self.__leaveConditionSets.compile()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# vim: set encoding=utf-8 tabstop=4 softtabstop=4 shiftwidth=4 expandtab
+#########################################################################
+#  Copyright 2014-     Thomas Ernst                       offline@gmx.net
+#########################################################################
+#  Finite state machine plugin for SmartHomeNG
+#
+#  This plugin is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This plugin is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this plugin. If not, see <http://www.gnu.org/licenses/>.
+#########################################################################
+import logging
+import math
+import datetime
+import threading
+from . import AutoBlindDefaults
+
+# Name of the scheduler job driving the timing wheel
+SCHEDULER_NAME = "AutoBlind: Delay Timer"
+
+# Static timing wheel object
+wheel = None
+""":type : AbTimingWheel"""
+
+
+# Init timing wheel and add scheduler job driving it
+# smarthome: Instance of smarthome.py-class
+# resolution: time (seconds) between two ticks of the wheel
+# size: number of slots of the wheel
+def init(smarthome, resolution=1, size=3600):
+    global wheel
+    stop()
+    wheel = AbTimingWheel(smarthome, resolution, size)
+    smarthome.scheduler.add(SCHEDULER_NAME, wheel.tick, cycle=resolution)
+
+
+# Stop timing wheel. Pending timers are discarded
+def stop():
+    global wheel
+    if wheel is not None:
+        wheel.stop()
+        wheel = None
+
+
+# Add a timer. A pending timer with the same key is replaced. The timer is ignored if the timing wheel has not been
+# initialized (or has been stopped)
+# key: key of timer
+# delay: delay (seconds)
+# callback: function to call when the timer is due
+# value: dict of keyword arguments for callback
+def add(key, delay, callback, value=None):
+    if wheel is None:
+        logging.getLogger(__name__).error("Delay timer {0} ignored: Timing wheel not initialized".format(key))
+        return
+    wheel.add(key, delay, callback, value)
+
+
+# Remove a timer
+# key: key of timer
+# returns: True = a pending timer has been removed, False = no timer pending
+def remove(key):
+    if wheel is None:
+        return False
+    return wheel.remove(key)
+
+
+# Class representing a hashed timing wheel for delayed actions. Timers are stored in the slot of the tick at which they
+# are due, so adding and removing timers does not depend on the number of pending timers. The wheel is advanced by a
+# single scheduler job, due timers are handed over to the scheduler, so a slow callback does not delay the others
+class AbTimingWheel:
+    # Constructor
+    # smarthome: Instance of smarthome.py-class
+    # resolution: time (seconds) between two ticks
+    # size: number of slots. Timers further ahead than one round stay in their slot until they are due
+    def __init__(self, smarthome, resolution=1, size=3600):
+        self.__sh = smarthome
+        self.__resolution = resolution
+        self.__slots = [{} for __ in range(size)]
+        self.__keys = {}
+        self.__lock = threading.Lock()
+        self.__start = smarthome.now()
+        self.__tick = 0
+
+    # Add a timer. A pending timer with the same key is replaced
+    # key: key of timer
+    # delay: delay (seconds)
+    # callback: function to call when the timer is due
+    # value: dict of keyword arguments for callback
+    def add(self, key, delay, callback, value=None):
+        elapsed = (self.__sh.now() - self.__start).total_seconds()
+        with self.__lock:
+            self.__remove(key)
+            due = max(self.__tick + 1, math.ceil((elapsed + delay) / self.__resolution))
+            slot = due % len(self.__slots)
+            self.__slots[slot][key] = (due, key, callback, value or {})
+            self.__keys[key] = slot
+
+    # Remove a timer
+    # key: key of timer
+    # returns: True = a pending timer has been removed, False = no timer pending
+    def remove(self, key):
+        with self.__lock:
+            return self.__remove(key)
+
+    # Return number of pending timers
+    def count(self):
+        return len(self.__keys)
+
+    # Return pending timers
+    # returns: list of tuples (due time, key) ordered by due time
+    def get_pending(self):
+        with self.__lock:
+            pending = [(self.__slots[slot][key][0], key) for key, slot in self.__keys.items()]
+        return [(self.__get_time(due), key) for due, key in sorted(pending, key=lambda x: x[0])]
+
+    # Stop timing wheel. Pending timers are discarded
+    def stop(self):
+        self.__sh.scheduler.remove(SCHEDULER_NAME)
+        with self.__lock:
+            for slot in self.__slots:
+                slot.clear()
+            self.__keys.clear()
+
+    # Advance the wheel to the current time and trigger all timers that are due (called by scheduler)
+    def tick(self):
+        current = int((self.__sh.now() - self.__start).total_seconds() / self.__resolution)
+        due_timers = []
+        with self.__lock:
+            # after a long pause each slot has to be checked only once
+            for tick in range(self.__tick + 1, self.__tick + 1 + min(current - self.__tick, len(self.__slots))):
+                slot = self.__slots[tick % len(self.__slots)]
+                for key in [key for key, timer in slot.items() if timer[0] <= current]:
+                    due_timers.append(slot.pop(key))
+                    del self.__keys[key]
+            self.__tick = max(self.__tick, current)
+
+        for due, key, callback, value in sorted(due_timers, key=lambda x: x[0]):
+            name = "{0}: {1}".format(SCHEDULER_NAME, "-".join(key) if isinstance(key, tuple) else key)
+            self.__sh.trigger(name, callback, by=AutoBlindDefaults.plugin_identification, value=value)
+
+    # Remove a timer (lock has to be held by caller)
+    # key: key of timer
+    # returns: True = a pending timer has been removed, False = no timer pending
+    def __remove(self, key):
+        slot = self.__keys.pop(key, None)
+        if slot is None:
+            return False
+        del self.__slots[slot][key]
+        return True
+
+    # Return point in time of a tick
+    # tick: number of tick
+    def __get_time(self, tick):
+        return self.__start + datetime.timedelta(seconds=tick * self.__resolution)
@@ -24,6 +24,13 @@ import datetime
 # Some general tool functions
 #
 
+# Cache of compiled eval expressions (key: source text of expression). Shared by all AbItems
+_compiled_evals = {}
+
+# Index of attributes visible for find_attribute (key: item id and recursion depth, value: dict of attributes).
+# Filled during startup
+_attribute_index = {}
+
 
 # Find a certain item below a given item.
 # item: Item to search below
@@ -126,24 +133,43 @@ def cast_time(value):
 # smarthome: instance of smarthome.py base class
 # base_item: base item to search in
 # attribute: name of attribute to find
-def find_attribute(smarthome, base_item, attribute, recursion_depth=0):
+def find_attribute(smarthome, base_item, attribute):
+    return get_attributes(smarthome, base_item).get(attribute)
+
+
+# return all attributes visible for find_attribute: the attributes of the parent item, completed by the attributes
+# visible for the "use"-item (recursively). The result is kept in an index until clear_attribute_index is called.
+# The returned dict must not be changed
+# smarthome: instance of smarthome.py base class
+# base_item: base item to search in
+# recursion_depth: current recursion depth ("use"-items are not followed after five levels)
+# returns: dict of attributes
+def get_attributes(smarthome, base_item, recursion_depth=0):
+    # the result depends on the recursion depth if the "use"-chain is truncated, so the depth is part of the key
+    key = (base_item.id(), recursion_depth)
+    attributes = _attribute_index.get(key)
+    if attributes is not None:
+        return attributes
+
     # 1: parent of given item could have attribute
     parent_item = base_item.return_parent()
-    if parent_item is not None and attribute in parent_item.conf:
-        return parent_item.conf[attribute]
+    attributes = {} if parent_item is None else parent_item.conf
 
-    # 2: if item has attribute "as_use", get the item to use and search this item for required attribute
-    if "as_use" in base_item.conf:
-        if recursion_depth > 5:
-            return None
+    # 2: if item has attribute "as_use", get the item to use and add the attributes visible for this item
+    if "as_use" in base_item.conf and recursion_depth <= 5:
         use_item = smarthome.return_item(base_item.conf["as_use"])
         if use_item is not None:
-            result = find_attribute(smarthome, use_item, attribute, recursion_depth + 1)
-            if result is not None:
-                return result
+            use_attributes = get_attributes(smarthome, use_item, recursion_depth + 1)
+            if len(use_attributes) > 0:
+                attributes = dict(use_attributes, **attributes)
 
-    # 3: nothing found
-    return None
+    _attribute_index[key] = attributes
+    return attributes
+
+
+# clear index of attributes used by find_attribute (after startup or if items have been changed)
+def clear_attribute_index():
+    _attribute_index.clear()
 
 
 # partition value at splitchar and strip resulting parts
@@ -172,6 +198,21 @@ def get_eval_name(eval_func):
             return eval_func.__module__ + "." + eval_func.__name__
 
 
+# compile an eval expression into a code object. Identical expressions are compiled only once.
+# Throws ValueError if the expression can not be compiled
+# source: source text of expression
+# returns: compiled code object
+def compile_eval(source):
+    code = _compiled_evals.get(source)
+    if code is None:
+        try:
+            code = compile(source, "<eval>", "eval")
+        except SyntaxError as ex:
+            raise ValueError("Can not compile eval '{0}': {1}".format(source, str(ex)))
+        _compiled_evals[source] = code
+    return code
+
+
 # determine original caller/source
 # smarthome: instance of smarthome.py
 # caller: caller
@@ -199,12 +240,19 @@ def get_original_caller(smarthome, caller, source, item=None):
 # - Protected wrapper-methods for logging
 # - abitem and smarthome Instances
 class AbItemChild:
+    __slots__ = ("_abitem", "_sh")
+
     # Constructor
     # abitem: parent AbItem instance
     def __init__(self, abitem):
         self._abitem = abitem
         self._sh = abitem.sh
 
+    # Flag: extended logging is active. Check before preparing expensive log output
+    @property
+    def _log_enabled(self):
+        return self._abitem.logger.enabled
+
     # wrapper method for logger.info
     def _log_info(self, text, *args):
         self._abitem.logger.info(text, *args)
@@ -21,9 +21,39 @@
 from . import AutoBlindTools
 from . import AutoBlindEval
 
+# Shared empty values (key: name of value)
+_empty_values = {}
+
 
 # Class representing a value for a condition (either value or via item/eval)
 class AbValue(AutoBlindTools.AbItemChild):
+    __slots__ = ("__name", "__allow_value_list", "__value", "__item", "__eval", "__eval_code", "__varname",
+                 "__cast_func")
+
+    # Return a shared empty value instead of the given value if the given value is empty. Shared empty values can not
+    # be changed, so this may only be used after the value has been completed
+    # value: AbValue instance
+    # returns: value or shared empty value with the same name
+    @staticmethod
+    def compact(value):
+        if not value.is_empty() or value._abitem is None:
+            return value
+        empty = _empty_values.get(value.__name)
+        if empty is None:
+            empty = AbValue.__new__(AbValue)
+            empty._abitem = None
+            empty._sh = None
+            empty.__name = value.__name
+            empty.__allow_value_list = False
+            empty.__value = None
+            empty.__item = None
+            empty.__eval = None
+            empty.__eval_code = None
+            empty.__varname = None
+            empty.__cast_func = None
+            empty = _empty_values.setdefault(value.__name, empty)
+        return empty
+
     # Constructor
     # abitem: parent AbItem instance
     # name: Name of value
@@ -36,6 +66,7 @@ class AbValue(AutoBlindTools.AbItemChild):
         self.__value = None
         self.__item = None
         self.__eval = None
+        self.__eval_code = None
         self.__varname = None
 
         if value_type == "str":
@@ -66,6 +97,8 @@ class AbValue(AutoBlindTools.AbItemChild):
     # value: string indicating value or source of value
     # name: name of object ("time" is being handeled different)
     def set(self, value, name=""):
+        if self._abitem is None:
+            raise ValueError("{0}: Shared empty value can not be changed".format(self.__name))
         if isinstance(value, list):
             source, field_value = AutoBlindTools.partition_strip(value[0], ":")
             if field_value == "":
@@ -94,11 +127,19 @@ class AbValue(AutoBlindTools.AbItemChild):
             self.__value = None
         self.__item = None if source != "item" else self._abitem.return_item(field_value)
         self.__eval = None if source != "eval" else field_value
+        self.__eval_code = None
+        if isinstance(self.__eval, str):
+            try:
+                self.__eval_code = AutoBlindTools.compile_eval(self.__eval)
+            except ValueError as ex:
+                raise ValueError("{0}: {1}".format(self.__name, str(ex)))
         self.__varname = None if source != "var" else field_value
 
     # Set cast function
     # cast_func: cast function
     def set_cast(self, cast_func):
+        if self._abitem is None:
+            return
         self.__cast_func = cast_func
         self.__value = self.__do_cast(self.__value)
 
@@ -127,6 +168,27 @@ class AbValue(AutoBlindTools.AbItemChild):
         else:
             return None
 
+    # Return estimated (relative) cost of determining the value
+    def get_cost(self):
+        if self.__eval is not None:
+            return 10 if isinstance(self.__eval, str) else 1
+        elif self.__item is not None:
+            return 2
+        elif self.__varname is not None:
+            return 1
+        else:
+            return 0
+
+    # Return ids of the items the value is read from
+    # returns: set of item ids or None if the value is determined by eval or variable
+    def get_dependencies(self):
+        if self.__eval is not None or self.__varname is not None:
+            return None
+        elif self.__item is not None:
+            return {self.__item.id()}
+        else:
+            return set()
+
     # Write condition to logger
     def write_to_logger(self):
         if self.__value is not None:
@@ -177,13 +239,8 @@ class AbValue(AutoBlindTools.AbItemChild):
     # Determine value by executing eval-function
     def __get_eval(self):
         if isinstance(self.__eval, str):
-            # noinspection PyUnusedLocal
-            sh = self._sh
-            if "autoblind_eval" in self.__eval:
-                # noinspection PyUnusedLocal
-                autoblind_eval = AutoBlindEval.AbEval(self._abitem)
             try:
-                value = eval(self.__eval)
+                value = self._abitem.get_eval_value(self.__eval, self.__evaluate)
             except Exception as ex:
                 self._log_info("Problem evaluating '{0}': {1}.", AutoBlindTools.get_eval_name(self.__eval), str(ex))
                 return None
@@ -197,11 +254,19 @@ class AbValue(AutoBlindTools.AbItemChild):
 
         return self.__do_cast(value)
 
+    # Evaluate eval expression
+    def __evaluate(self):
+        # noinspection PyUnusedLocal
+        sh = self._sh
+        if "autoblind_eval" in self.__eval:
+            # noinspection PyUnusedLocal
+            autoblind_eval = AutoBlindEval.AbEval(self._abitem)
+        return eval(self.__eval_code)
+
     # Determine value from item
     def __get_from_item(self):
         try:
-            # noinspection PyCallingNonCallable
-            value = self.__item()
+            value = self._abitem.get_item_value(self.__item)
         except Exception as ex:
             self._log_info("Problem while reading item '{0}': {1}.", self.__item.id(), str(ex))
             return None
@@ -25,8 +25,13 @@ from . import AutoBlindDefaults
 from . import AutoBlindTools
 from . import AutoBlindCliCommands
 from . import AutoBlindFunctions
+from . import AutoBlindDispatcher
+from . import AutoBlindTimer
+from . import AutoBlindExecutor
 import logging
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from lib.model.smartplugin import SmartPlugin
 
 
@@ -40,6 +45,18 @@ class AutoBlind(SmartPlugin):
     # manual_break_default: default break after manual changes of items
     # log_level: loglevel for extended logging
     # log_directory: directory for extended logging files
+    # compile_conditions: generate specialized functions for checking condition sets
+    # startup_threads: number of threads for initializing the AutoBlind items
+    # update_batch_window: time (seconds) to collect item updates and run them as batch (0: no batching)
+    # update_threads: number of threads for running a batch of item updates
+    # sun_cache_time: time (seconds) for which a determined sun position is reused (only if sun_table is False)
+    # sun_table: determine sun positions from a precomputed daily table
+    # byattr_chunk_size: number of items set at once by "as_byattr" actions (0: all items at once)
+    # byattr_chunk_interval: time (seconds) between two chunks of items set by "as_byattr" actions
+    # run_threads: number of threads for running asynchronous "as_run" actions (0: run during the update)
+    # run_queue_limit: maximum number of asynchronous "as_run" actions waiting or running
+    # run_timeout: time (seconds) after which commands are killed and asynchronous "as_run" actions are reported as
+    #              hanging
     def __init__(self,
                  smarthome,
                  startup_delay_default=10,
@@ -49,7 +66,18 @@ class AutoBlind(SmartPlugin):
                  log_directory="var/log/AutoBlind/",
                  log_maxage="0",
                  laststate_name_manually_locked="Manuell gesperrt",
-                 laststate_name_suspended="Ausgesetzt bis %X"):
+                 laststate_name_suspended="Ausgesetzt bis %X",
+                 compile_conditions=True,
+                 startup_threads=4,
+                 update_batch_window=0.05,
+                 update_threads=1,
+                 sun_cache_time=30,
+                 sun_table=True,
+                 byattr_chunk_size=0,
+                 byattr_chunk_interval=1,
+                 run_threads=2,
+                 run_queue_limit=100,
+                 run_timeout=60):
 
         self.logger = logging.getLogger(__name__)
         self._sh = smarthome
@@ -63,15 +91,31 @@ class AutoBlind(SmartPlugin):
         AutoBlindDefaults.suspend_time = int(suspend_time_default)
         AutoBlindDefaults.laststate_name_manually_locked = laststate_name_manually_locked
         AutoBlindDefaults.laststate_name_suspended = laststate_name_suspended
+        AutoBlindDefaults.compile_conditions = AutoBlindTools.cast_bool(compile_conditions)
+        AutoBlindDefaults.startup_threads = max(1, int(startup_threads))
+        AutoBlindDefaults.update_batch_window = float(update_batch_window)
+        AutoBlindDefaults.update_threads = max(1, int(update_threads))
+        AutoBlindDefaults.sun_cache_time = AutoBlindTools.cast_num(sun_cache_time)
+        AutoBlindDefaults.sun_table = AutoBlindTools.cast_bool(sun_table)
+        AutoBlindDefaults.byattr_chunk_size = max(0, int(byattr_chunk_size))
+        AutoBlindDefaults.byattr_chunk_interval = max(1, int(byattr_chunk_interval))
+        AutoBlindDefaults.run_threads = max(0, int(run_threads))
+        AutoBlindDefaults.run_queue_limit = max(1, int(run_queue_limit))
+        AutoBlindDefaults.run_timeout = AutoBlindTools.cast_num(run_timeout)
         AutoBlindDefaults.write_to_log()
 
         if manual_break_default != 0:
             text = "Using obsolete plugin config attribute 'manual_break_default'. Change to 'suspend_time_default'!"
             self.logger.warning(text)
 
-        AutoBlindCurrent.init(smarthome)
+        AutoBlindCurrent.init(smarthome, AutoBlindDefaults.sun_cache_time, AutoBlindDefaults.sun_table)
+        AutoBlindDispatcher.init(AutoBlindDefaults.update_batch_window, AutoBlindDefaults.update_threads)
+        AutoBlindTimer.init(smarthome)
+        AutoBlindExecutor.init(AutoBlindDefaults.run_threads, AutoBlindDefaults.run_queue_limit,
+                               AutoBlindDefaults.run_timeout)
 
         log_level = AutoBlindTools.cast_num(log_level)
+        AbLogger.set_loglevel(log_level)
         if log_level > 0:
             if log_directory[0] != "/":
                 base = self._sh.base_dir
@@ -80,7 +124,6 @@ class AutoBlind(SmartPlugin):
                 log_directory = base + log_directory
             if not os.path.exists(log_directory):
                 os.makedirs(log_directory)
-            AbLogger.set_loglevel(log_level)
             AbLogger.set_logdirectory(log_directory)
             text = "AutoBlind extended logging is active. Logging to '{0}' with loglevel {1}."
             self.logger.info(text.format(log_directory, log_level))
@@ -107,13 +150,30 @@ class AutoBlind(SmartPlugin):
     def run(self):
         # Initialize
         self.logger.info("Init AutoBlind items")
-        for item in self._sh.find_items("as_plugin"):
-            if item.conf["as_plugin"] == "active":
-                try:
-                    ab_item = AutoBlindItem.AbItem(self._sh, item)
-                    self.__items[ab_item.id] = ab_item
-                except ValueError as ex:
-                    self.logger.error("Item: {0}: {1}".format(item.id(), str(ex)))
+        items = [item for item in self._sh.find_items("as_plugin") if item.conf["as_plugin"] == "active"]
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=AutoBlindDefaults.startup_threads) as executor:
+            futures = [executor.submit(self.__create_item, item) for item in items]
+
+        # register items in order of configuration, independent of the order in which they have been initialized
+        durations = []
+        for item, future in zip(items, futures):
+            ab_item, duration, error = future.result()
+            durations.append((duration, item.id()))
+            if error is not None:
+                self.logger.error("Item: {0}: {1}".format(item.id(), error))
+            else:
+                self.__items[ab_item.id] = ab_item
+            self.logger.debug("Init of item {0} took {1:.1f} ms".format(item.id(), duration * 1000))
+        if len(durations) > 0:
+            text = "Init of {0} AutoBlind items took {1:.1f} ms. Slowest items: {2}"
+            slowest = ", ".join("{0} ({1:.1f} ms)".format(item_id, duration * 1000)
+                                for duration, item_id in sorted(durations, reverse=True)[:5])
+            self.logger.info(text.format(len(durations), (time.perf_counter() - start) * 1000, slowest))
+        # items are initialized in parallel: the first updates may only run when all items are complete
+        for ab_item in self.__items.values():
+            ab_item.startup()
+        AutoBlindTools.clear_attribute_index()
 
         if len(self.__items) > 0:
             self.logger.info("Using AutoBlind for {} items".format(len(self.__items)))
@@ -125,9 +185,24 @@ class AutoBlind(SmartPlugin):
         self.alive = True
         self._sh.autoblind_plugin_functions.ab_alive = True
 
+    # Initialize a single AutoBlind item (executed in thread pool)
+    # item: item to initialize
+    # returns: tuple (AbItem instance or None, duration of initialization in seconds, error text or None)
+    def __create_item(self, item):
+        start = time.perf_counter()
+        try:
+            ab_item = AutoBlindItem.AbItem(self._sh, item)
+            return ab_item, time.perf_counter() - start, None
+        except ValueError as ex:
+            return None, time.perf_counter() - start, str(ex)
+
     # Stopping of plugin
     def stop(self):
         self.alive = False
+        AutoBlindDispatcher.stop()
+        AutoBlindTimer.stop()
+        AutoBlindExecutor.stop()
+        AbLogger.stop_writer()
 
     # Determine if caller/source are contained in changed_by list
     # caller: Caller to check
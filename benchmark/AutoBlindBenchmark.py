@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+# vim: set encoding=utf-8 tabstop=4 softtabstop=4 shiftwidth=4 expandtab
+#########################################################################
+#  Copyright 2014-     Thomas Ernst                       offline@gmx.net
+#########################################################################
+#  Finite state machine plugin for SmartHomeNG
+#
+#  This plugin is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This plugin is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this plugin. If not, see <http://www.gnu.org/licenses/>.
+#########################################################################
+#
+# Benchmark for the AutoBlind plugin using the mock SmartHomeNG in AutoBlindMock.
+#
+# Measures construction time of AbItems and latency/throughput of update_state depending on the number of items,
+# states and conditions. Run "python3 AutoBlindBenchmark.py --help" for options.
+#
+import argparse
+import logging
+import random
+import tempfile
+import time
+import AutoBlindMock
+
+
+# Generated configuration of AutoBlind items in a MockSmartHome instance
+class BenchmarkScenario:
+    # Constructor
+    # items: number of AutoBlind items
+    # states: number of states per AutoBlind item
+    # conditions: number of conditions per state (and number of input items)
+    # seed: seed for random generator
+    # log_level: loglevel for extended logging
+    # log_directory: directory for extended logging files
+    # template: all items use the same template states via "as_use"
+    def __init__(self, items, states, conditions, seed=0, log_level=0, log_directory=None, template=False):
+        self.random = random.Random(seed)
+        self.sh = AutoBlindMock.create_smarthome(log_level=log_level, log_directory=log_directory)
+        self.plugin = AutoBlindMock.load_plugin()
+        self.inputs = []
+        self.objects = []
+        self.abitems = []
+
+        self.sh.add_item("bench")
+        for condition in range(conditions):
+            self.inputs.append(self.sh.add_item("bench.input{0}".format(condition), "num", 50))
+        if template:
+            self.sh.add_item("bench.template")
+            for state in range(states):
+                self.__add_state("bench.template.state{0}".format(state), state, states, conditions)
+        for item in range(items):
+            self.objects.append(self.__add_object(item, states, conditions, template))
+
+    # Create AbItems for all object items
+    # returns: seconds per AbItem
+    def construct(self):
+        start = time.perf_counter()
+        for item in self.objects:
+            self.abitems.append(self.plugin.AutoBlindItem.AbItem(self.sh, item))
+        for abitem in self.abitems:
+            abitem.startup()
+        return (time.perf_counter() - start) / len(self.objects)
+
+    # Change inputs randomly and call update_state of each AbItem directly
+    # updates: number of updates
+    # returns: list of durations (seconds) of update_state calls
+    def measure_latency(self, updates):
+        durations = []
+        for update in range(updates):
+            changed = self.random.choice(self.inputs)
+            changed.set(self.random.randint(0, 100), trigger=False)
+            abitem = self.abitems[update % len(self.abitems)]
+            item = self.objects[update % len(self.objects)]
+            self.sh.advance(1)
+            start = time.perf_counter()
+            abitem.update_state(item, "Eval", changed.id())
+            durations.append(time.perf_counter() - start)
+        return durations
+
+    # Change inputs randomly and let the eval triggers update all AbItems
+    # changes: number of input changes
+    # returns: number of update_state calls per second
+    def measure_throughput(self, changes):
+        start = time.perf_counter()
+        for change in range(changes):
+            self.sh.advance(1)
+            self.random.choice(self.inputs).set(self.random.randint(0, 100), "Benchmark")
+        duration = time.perf_counter() - start
+        return changes * len(self.abitems) / duration if duration > 0 else 0
+
+    # Create an object item with states and conditions
+    # number: number of object item
+    # states: number of states
+    # conditions: number of conditions per state
+    # template: use template states via "as_use" instead of own states
+    def __add_object(self, number, states, conditions, template):
+        path = "bench.blind{0}".format(number)
+        self.sh.add_item(path + "_height", "num", 0)
+        self.sh.add_item(path + "_laststate", "str", "")
+        conf = {
+            "as_plugin": "active",
+            "as_startup_delay": "-1",
+            "as_laststate_item_id": path + "_laststate",
+            "as_item_height": path + "_height"
+        }
+        for condition in range(conditions):
+            conf["as_item_c{0}".format(condition)] = "bench.input{0}".format(condition)
+        item = self.sh.add_item(path, "num", 0, conf)
+        self.sh.set_eval_trigger(item, ["bench.input*"])
+
+        for state in range(states):
+            state_path = "{0}.state{1}".format(path, state)
+            if template:
+                self.sh.add_item(state_path, conf={"as_use": "bench.template.state{0}".format(state)})
+            else:
+                self.__add_state(state_path, state, states, conditions)
+        return item
+
+    # Create a state item with an enter condition set
+    # path: id of state item
+    # state: number of state
+    # states: number of states
+    # conditions: number of conditions
+    def __add_state(self, path, state, states, conditions):
+        self.sh.add_item(path, conf={"as_name": "State {0}".format(state), "as_set_height": str(state)})
+        # the last state has no conditions and is used if no other state matches
+        if state == states - 1:
+            return
+        enter = {}
+        for condition in range(conditions):
+            minimum = self.random.randint(0, 50)
+            enter["as_min_c{0}".format(condition)] = str(minimum)
+            enter["as_max_c{0}".format(condition)] = str(minimum + self.random.randint(30, 50))
+        self.sh.add_item(path + ".enter", conf=enter)
+
+
+# Return percentile of a sorted list of values
+# values: sorted list of values
+# percent: percentile to return (0-100)
+def percentile(values, percent):
+    if len(values) == 0:
+        return 0
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+# Run benchmark for a single configuration
+# items: number of AutoBlind items
+# states: number of states per AutoBlind item
+# conditions: number of conditions per state
+# updates: number of updates to measure
+# seed: seed for random generator
+# log_level: loglevel for extended logging
+# log_directory: directory for extended logging files
+# template: all items use the same template states via "as_use"
+# returns: dict of results
+def run(items, states, conditions, updates, seed=0, log_level=0, log_directory=None, template=False):
+    scenario = BenchmarkScenario(items, states, conditions, seed, log_level, log_directory, template)
+    construct = scenario.construct()
+    latencies = sorted(scenario.measure_latency(updates))
+    throughput = scenario.measure_throughput(max(1, updates // items))
+    scenario.plugin.AutoBlindLogger.AbLogger.stop_writer()
+    return {
+        "items": items,
+        "states": states,
+        "conditions": conditions,
+        "construct_ms": construct * 1000,
+        "median_us": percentile(latencies, 50) * 1000000,
+        "p95_us": percentile(latencies, 95) * 1000000,
+        "throughput": throughput,
+        "writes": scenario.sh.writes
+    }
+
+
+# Print results as table
+# results: list of result dicts
+def print_results(results):
+    header = "{0:>6} {1:>6} {2:>10} {3:>12} {4:>11} {5:>11} {6:>14} {7:>8}"
+    line = "{items:>6} {states:>6} {conditions:>10} {construct_ms:>12.3f} {median_us:>11.1f} {p95_us:>11.1f} " \
+           "{throughput:>14.0f} {writes:>8}"
+    print(header.format("items", "states", "conditions", "construct ms", "median us", "p95 us", "updates/s", "writes"))
+    for result in results:
+        print(line.format(**result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark for the AutoBlind plugin (without SmartHomeNG)")
+    parser.add_argument("--items", type=int, default=10, help="number of AutoBlind items")
+    parser.add_argument("--states", type=int, default=5, help="number of states per item")
+    parser.add_argument("--conditions", type=int, default=3, help="number of conditions per state")
+    parser.add_argument("--updates", type=int, default=1000, help="number of updates to measure")
+    parser.add_argument("--scale", action="store_true", help="double items, states and conditions step by step")
+    parser.add_argument("--steps", type=int, default=4, help="number of steps for --scale")
+    parser.add_argument("--seed", type=int, default=0, help="seed for random generator")
+    parser.add_argument("--template", action="store_true", help="use template states (as_use) for all items")
+    parser.add_argument("--log-level", type=int, default=0, help="loglevel for extended logging")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    log_directory = tempfile.mkdtemp(prefix="autoblind-benchmark-") if args.log_level > 0 else None
+
+    configurations = [(args.items, args.states, args.conditions)]
+    if args.scale:
+        for step in range(1, args.steps):
+            configurations.append((args.items * 2 ** step, args.states, args.conditions))
+        for step in range(1, args.steps):
+            configurations.append((args.items, args.states * 2 ** step, args.conditions))
+        for step in range(1, args.steps):
+            configurations.append((args.items, args.states, args.conditions * 2 ** step))
+
+    results = []
+    for items, states, conditions in configurations:
+        results.append(run(items, states, conditions, args.updates, args.seed, args.log_level, log_directory,
+                           args.template))
+    print_results(results)
+    if log_directory is not None:
+        print("Extended log files written to {0}".format(log_directory))
+
+
+if __name__ == "__main__":
+    main()
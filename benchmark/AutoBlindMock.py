@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+# vim: set encoding=utf-8 tabstop=4 softtabstop=4 shiftwidth=4 expandtab
+#########################################################################
+#  Copyright 2014-     Thomas Ernst                       offline@gmx.net
+#########################################################################
+#  Finite state machine plugin for SmartHomeNG
+#
+#  This plugin is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This plugin is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this plugin. If not, see <http://www.gnu.org/licenses/>.
+#########################################################################
+#
+# Stand-in for the parts of SmartHomeNG used by the AutoBlind plugin. Allows to create and update AbItems without
+# a running SmartHomeNG instance (for benchmarks and experiments).
+#
+import datetime
+import importlib
+import math
+import os
+import re
+import sys
+import types
+
+# Name of the package the plugin modules are loaded into
+PACKAGE_NAME = "autoblind"
+
+
+# Load the plugin modules without running the plugin class in __init__.py (which requires SmartHomeNG)
+# returns: package containing the plugin modules
+def load_plugin():
+    if PACKAGE_NAME in sys.modules:
+        return sys.modules[PACKAGE_NAME]
+    package = types.ModuleType(PACKAGE_NAME)
+    package.__path__ = [os.path.dirname(os.path.dirname(os.path.abspath(__file__)))]
+    sys.modules[PACKAGE_NAME] = package
+    for module in ("AutoBlindTools", "AutoBlindDefaults", "AutoBlindLogger", "AutoBlindCurrent", "AutoBlindTimer",
+                   "AutoBlindFunctions", "AutoBlindItem"):
+        setattr(package, module, importlib.import_module(PACKAGE_NAME + "." + module))
+    return package
+
+
+# Simulated clock. Time only advances when requested
+class MockClock:
+    # Constructor
+    # start: start time (timezone aware datetime). Default: today at 12:00 (local time)
+    def __init__(self, start=None):
+        if start is None:
+            start = datetime.datetime.now().astimezone().replace(hour=12, minute=0, second=0, microsecond=0)
+        self.__now = start
+
+    # Return current simulated time
+    def now(self):
+        return self.__now
+
+    # Advance simulated time
+    # seconds: number of seconds to advance
+    def advance(self, seconds):
+        self.__now += datetime.timedelta(seconds=seconds)
+
+
+# Item with the attributes and methods of SmartHomeNG items used by the plugin
+class MockItem:
+    # Constructor
+    # smarthome: MockSmartHome instance
+    # path: id of item
+    # item_type: type of item (num, str, bool, foo)
+    # value: initial value
+    # conf: item configuration (attributes)
+    # name: name of item (default: id)
+    def __init__(self, smarthome, path, item_type="foo", value=None, conf=None, name=None):
+        self._sh = smarthome
+        self._path = path
+        self._name = path if name is None else name
+        self._type = item_type
+        self._value = value
+        self._eval = None
+        self._eval_trigger = None
+        self._enforce_updates = False
+        self.conf = {} if conf is None else conf
+        self.__parent = None
+        self.__children = []
+        self.__method_triggers = []
+        self.__last_change = smarthome.now()
+        self.__changed_by = "Init:None"
+
+    # Return or set value
+    # value: new value (None: return value)
+    # caller: caller of update
+    # source: source of update
+    # dest: destination of update
+    def __call__(self, value=None, caller="Logic", source=None, dest=None):
+        if value is None:
+            return self._value
+        self.set(value, caller, source, dest)
+
+    def __str__(self):
+        return self._name
+
+    # Set value and run triggers
+    # value: new value
+    # caller: caller of update
+    # source: source of update
+    # dest: destination of update
+    # trigger: run method triggers and eval triggers
+    def set(self, value, caller="Logic", source=None, dest=None, trigger=True):
+        value = self.cast(value)
+        changed = value != self._value
+        self._value = value
+        if changed:
+            self.__last_change = self._sh.now()
+            self.__changed_by = "{0}:{1}".format(caller, source)
+        self._sh.count_write(self, caller)
+        if trigger and (changed or self._enforce_updates):
+            for method in self.__method_triggers:
+                method(self, caller, source, dest)
+            if changed:
+                self._sh.run_eval_triggers(self)
+
+    # Cast value to the type of the item
+    # value: value to cast
+    def cast(self, value):
+        if self._type == "num":
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                return value
+            value = str(value)
+            return float(value) if "." in value else int(value)
+        elif self._type == "bool":
+            if isinstance(value, str):
+                return value.lower() in ("1", "true", "yes", "on")
+            return bool(value)
+        elif self._type == "str":
+            return str(value)
+        return value
+
+    def id(self):
+        return self._path
+
+    def return_parent(self):
+        return self.__parent
+
+    def return_children(self):
+        return list(self.__children)
+
+    def add_child(self, child):
+        child.__parent = self
+        self.__children.append(child)
+
+    def age(self):
+        return (self._sh.now() - self.__last_change).total_seconds()
+
+    def last_change(self):
+        return self.__last_change
+
+    def changed_by(self):
+        return self.__changed_by
+
+    def add_method_trigger(self, method):
+        self.__method_triggers.append(method)
+
+    def timer(self, time, value):
+        pass
+
+
+# Scheduler running jobs when the simulated clock passes their next run
+class MockScheduler:
+    # Constructor
+    # smarthome: MockSmartHome instance
+    def __init__(self, smarthome):
+        self.__sh = smarthome
+        self.__jobs = {}
+        self._scheduler = {}
+
+    # Add a job
+    # name: name of job
+    # obj: callable to run
+    # value: dict of keyword arguments for obj
+    # cycle: interval (seconds) for repeated runs
+    # next: next run (datetime)
+    def add(self, name, obj, prio=3, cron=None, cycle=None, value=None, offset=None, next=None):
+        if next is None and cycle is not None:
+            next = self.__sh.now() + datetime.timedelta(seconds=cycle)
+        self.__jobs[name] = {"obj": obj, "value": value, "next": next, "cycle": cycle}
+        self._scheduler[name] = {"cron": cron, "cycle": cycle, "next": next}
+
+    def remove(self, name):
+        self.__jobs.pop(name, None)
+        self._scheduler.pop(name, None)
+
+    def change(self, name, **kwargs):
+        if name in self._scheduler:
+            self._scheduler[name].update(kwargs)
+
+    def return_next(self, name):
+        job = self.__jobs.get(name)
+        return None if job is None else job["next"]
+
+    # Number of (non cyclic) jobs waiting for their next run
+    def count_pending(self):
+        return sum(1 for job in self.__jobs.values() if job["next"] is not None and job["cycle"] is None)
+
+    # Run all jobs whose next run is not after the current simulated time. Cyclic jobs are run once and rescheduled
+    # returns: number of jobs run
+    def run_due(self):
+        count = 0
+        now = self.__sh.now()
+        due = [(job["next"], name) for name, job in self.__jobs.items() if job["next"] is not None and job["next"] <= now]
+        for __, name in sorted(due):
+            job = self.__jobs.get(name)
+            if job is None:
+                continue
+            if job["cycle"] is None:
+                del self.__jobs[name]
+                self._scheduler.pop(name, None)
+            else:
+                job["next"] = now + datetime.timedelta(seconds=job["cycle"])
+            job["obj"](**(job["value"] or {}))
+            count += 1
+        return count
+
+
+# Simple sun model: the sun circles once a day, highest at 12:00 (local time of simulated clock at creation). Like the
+# real sun, the model follows real time and not the local time, so noon moves by one hour on DST changes
+class MockSun:
+    # Constructor
+    # smarthome: MockSmartHome instance
+    # max_altitude: altitude at noon (degrees)
+    # min_altitude: altitude at midnight (degrees)
+    def __init__(self, smarthome, max_altitude=60, min_altitude=-40):
+        self.__sh = smarthome
+        self.__utc_offset = smarthome.now().utcoffset() or datetime.timedelta()
+        self.__mean = math.radians((max_altitude + min_altitude) / 2)
+        self.__amplitude = math.radians((max_altitude - min_altitude) / 2)
+
+    # Return azimut and altitude (radians)
+    # offset: offset from now (real minutes)
+    def pos(self, offset=None):
+        now = self.__sh.now().astimezone(datetime.timezone.utc) + self.__utc_offset
+        if offset:
+            now += datetime.timedelta(minutes=offset)
+        minutes = now.hour * 60 + now.minute + now.second / 60
+        angle = 2 * math.pi * minutes / 1440
+        azimut = angle
+        altitude = self.__mean - self.__amplitude * math.cos(angle)
+        return azimut, altitude
+
+
+# Stand-in for SmartHomeNG main object
+class MockSmartHome:
+    # Constructor
+    # clock: MockClock instance (Default: new clock)
+    # base_dir: base directory
+    def __init__(self, clock=None, base_dir="/tmp"):
+        self.base_dir = base_dir
+        self.clock = MockClock() if clock is None else clock
+        self.scheduler = MockScheduler(self)
+        self.sun = MockSun(self)
+        self.writes = 0
+        self.write_callers = {}
+        self.__items = {}
+        self.__eval_triggers = []
+
+    def now(self):
+        return self.clock.now()
+
+    # Create an item. The parent item has to exist already (if the id contains a ".")
+    # path: id of item
+    # item_type: type of item (num, str, bool, foo)
+    # value: initial value
+    # conf: item configuration (attributes)
+    # name: name of item (default: id)
+    # returns: created item
+    def add_item(self, path, item_type="foo", value=None, conf=None, name=None):
+        item = MockItem(self, path, item_type, value, conf, name)
+        parent_path = path.rpartition(".")[0]
+        if parent_path != "":
+            self.__items[parent_path].add_child(item)
+        self.__items[path] = item
+        return item
+
+    # Set the eval trigger of an item: the item is set to "1" with caller "Eval" whenever one of the matching items
+    # changes
+    # item: item to set eval trigger for
+    # triggers: list of item ids or patterns
+    def set_eval_trigger(self, item, triggers):
+        item._eval_trigger = triggers
+        for trigger in triggers:
+            self.__eval_triggers.append((self.__compile_pattern(trigger), item))
+
+    # Run eval triggers after item has been changed
+    # item: changed item
+    def run_eval_triggers(self, item):
+        for pattern, target in self.__eval_triggers:
+            if pattern.match(item.id()):
+                target.set(1 if target._eval is None else target._eval, "Eval", item.id())
+
+    # Count item writes (by caller)
+    # item: item that has been written
+    # caller: caller of the write
+    def count_write(self, item, caller):
+        self.writes += 1
+        self.write_callers[caller] = self.write_callers.get(caller, 0) + 1
+
+    # Advance simulated time and run due scheduler jobs
+    # seconds: number of seconds to advance
+    # returns: number of jobs run
+    def advance(self, seconds):
+        self.clock.advance(seconds)
+        return self.scheduler.run_due()
+
+    def return_item(self, path):
+        return self.__items.get(path)
+
+    def return_items(self):
+        return self.__items.values()
+
+    def find_items(self, conf):
+        return [item for item in self.__items.values() if conf in item.conf]
+
+    def match_items(self, regex):
+        pattern = self.__compile_pattern(regex)
+        return [item for path, item in self.__items.items() if pattern.match(path)]
+
+    # Run a method immediately (logics and items are not triggered)
+    def trigger(self, name, obj=None, by="Logic", source=None, value=None, dest=None, prio=3, dt=None):
+        if callable(obj):
+            obj(**(value or {}))
+
+    def return_plugins(self):
+        return []
+
+    @staticmethod
+    def __compile_pattern(regex):
+        return re.compile(regex.replace(".", "\\.").replace("*", ".*") + "$")
+
+
+# Create a MockSmartHome instance which is ready to be used by AbItems
+# clock: MockClock instance (Default: new clock)
+# log_level: loglevel for extended logging
+# log_directory: directory for extended logging files (required if log_level > 0)
+# returns: MockSmartHome instance
+def create_smarthome(clock=None, log_level=0, log_directory=None):
+    plugin = load_plugin()
+    smarthome = MockSmartHome(clock)
+    plugin.AutoBlindLogger.AbLogger.set_loglevel(log_level)
+    if log_level > 0:
+        if not log_directory.endswith("/"):
+            log_directory += "/"
+        os.makedirs(log_directory, exist_ok=True)
+        plugin.AutoBlindLogger.AbLogger.set_logdirectory(log_directory)
+    plugin.AutoBlindCurrent.init(smarthome)
+    plugin.AutoBlindTimer.init(smarthome)
+    smarthome.autoblind_plugin_functions = plugin.AutoBlindFunctions.AbFunctions(smarthome)
+    smarthome.autoblind_plugin_functions.ab_alive = True
+    return smarthome
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+# vim: set encoding=utf-8 tabstop=4 softtabstop=4 shiftwidth=4 expandtab
+#########################################################################
+#  Copyright 2014-     Thomas Ernst                       offline@gmx.net
+#########################################################################
+#  Finite state machine plugin for SmartHomeNG
+#
+#  This plugin is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This plugin is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this plugin. If not, see <http://www.gnu.org/licenses/>.
+#########################################################################
+import threading
+import AutoBlindMock
+
+
+# Stand-in for an "as_set" (forces=False) or "as_force" (forces=True) action recording its writes
+class Action:
+    def __init__(self, writes, forces=False, result=True):
+        self._forces_write = forces
+        self.__writes = writes
+        self.__result = result
+
+    def _write(self, value, actionname, repeat_text=""):
+        self.__writes.append((actionname, value))
+        return self.__result
+
+
+# Create an AbItem and a write plan for it
+# returns: tuple (smarthome, plugin package, write plan)
+def create_write_plan():
+    plugin = AutoBlindMock.load_plugin()
+    sh = AutoBlindMock.create_smarthome()
+    sh.add_item("w")
+    item = sh.add_item("w.o", "num", 0, {"as_plugin": "active", "as_startup_delay": "-1"})
+    sh.add_item("w.o.state", conf={"as_name": "state"})
+    abitem = plugin.AutoBlindItem.AbItem(sh, item)
+    return sh, plugin, plugin.AutoBlindAction.AbWritePlan(abitem)
+
+
+# Return the change of the write statistics since the given statistics
+def statistics_delta(plugin, before):
+    after = plugin.AutoBlindAction.get_write_statistics()
+    return {name: after[name] - before[name] for name in after}
+
+
+# Writes are executed even if the item already has the value (the item may enforce updates)
+def test_write_plan_unchanged_value():
+    sh, plugin, plan = create_write_plan()
+    target = sh.add_item("w.target", "num", 5)
+    writes = []
+    plan.add(target, Action(writes), 5, "set", "")
+    plan.close()
+    assert writes == [("set", 5)]
+
+
+# Only the last write to an item is executed. Writes are executed in the order in which they have been added
+def test_write_plan_dedup():
+    sh, plugin, plan = create_write_plan()
+    first = sh.add_item("w.first", "num", 0)
+    second = sh.add_item("w.second", "num", 0)
+    writes = []
+    before = plugin.AutoBlindAction.get_write_statistics()
+    plan.add(first, Action(writes), 1, "a", "")
+    plan.add(second, Action(writes), 2, "b", "")
+    plan.add(first, Action(writes), 3, "c", "")
+    plan.close()
+    assert writes == [("b", 2), ("c", 3)]
+    assert statistics_delta(plugin, before) == {"planned": 3, "written": 2, "overwritten": 1, "mindelta": 0}
+
+
+# A later "set" to the same value does not remove a "force", a "set" to another value or a later "force" replaces it
+def test_write_plan_force_precedence():
+    sh, plugin, plan = create_write_plan()
+    target = sh.add_item("w.target", "num", 5)
+    writes = []
+    plan.add(target, Action(writes, forces=True), 5, "force", "")
+    plan.add(target, Action(writes), 5, "set", "")
+    plan.flush()
+    assert writes == [("force", 5)]
+
+    writes.clear()
+    plan.add(target, Action(writes, forces=True), 5, "force", "")
+    plan.add(target, Action(writes), 6, "set", "")
+    plan.flush()
+    assert writes == [("set", 6)]
+
+    writes.clear()
+    plan.add(target, Action(writes), 5, "set", "")
+    plan.add(target, Action(writes, forces=True), 5, "force", "")
+    plan.close()
+    assert writes == [("force", 5)]
+
+
+# Writes skipped because of mindelta are counted separately
+def test_write_plan_statistics_mindelta():
+    sh, plugin, plan = create_write_plan()
+    target = sh.add_item("w.target", "num", 5)
+    writes = []
+    before = plugin.AutoBlindAction.get_write_statistics()
+    plan.add(target, Action(writes, result=False), 6, "set", "")
+    plan.close()
+    assert statistics_delta(plugin, before) == {"planned": 1, "written": 0, "overwritten": 0, "mindelta": 1}
+
+
+# Create an AbItem with items "p.a", "p.b" and "p.c" to be set by actions and item "p.order" for dynamic orders
+# returns: tuple (smarthome, plugin package, AbItem, state item, list collecting the ids of written items)
+def create_actions_item():
+    plugin = AutoBlindMock.load_plugin()
+    sh = AutoBlindMock.create_smarthome()
+    sh.add_item("p")
+    writes = []
+    for name in ("a", "b", "c"):
+        target = sh.add_item("p." + name, "num", 0)
+        target._enforce_updates = True
+        target.add_method_trigger(lambda item, caller, source, dest: writes.append(item.id()))
+    sh.add_item("p.order", "num", 2)
+    conf = {"as_plugin": "active", "as_startup_delay": "-1", "as_item_a": "p.a", "as_item_b": "p.b",
+            "as_item_c": "p.c"}
+    item = sh.add_item("p.o", "num", 0, conf)
+    state = sh.add_item("p.o.state", conf={"as_name": "state"})
+    abitem = plugin.AutoBlindItem.AbItem(sh, item)
+    return sh, plugin, abitem, state, writes
+
+
+# Create a list of "as_set" actions with the given orders
+# orders: dict (key: name of action, value: order)
+def create_actions(plugin, abitem, state, orders):
+    actions = plugin.AutoBlindActions.AbActions(abitem)
+    for name, order in orders.items():
+        actions.update("as_set_" + name, "1")
+        actions.update("as_order_" + name, order)
+    actions.complete(state)
+    return actions
+
+
+# Execute actions and return the ids of the items written
+def execute(actions, writes, additional_actions=None):
+    writes.clear()
+    actions.execute(False, True, additional_actions)
+    return list(writes)
+
+
+# The cached order of actions is rebuilt when the actions are changed
+def test_action_plan_update():
+    sh, plugin, abitem, state, writes = create_actions_item()
+    actions = create_actions(plugin, abitem, state, {"a": "2", "b": "1"})
+    assert execute(actions, writes) == ["p.b", "p.a"]
+    actions.update("as_order_a", "0")
+    assert execute(actions, writes) == ["p.a", "p.b"]
+    actions.update("as_set_c", "1")
+    actions.update("as_order_c", "0")
+    actions.complete(state)
+    assert execute(actions, writes) == ["p.a", "p.c", "p.b"]
+
+
+# The cached order of actions is rebuilt when an order determined dynamically changes
+def test_action_plan_dynamic_order():
+    sh, plugin, abitem, state, writes = create_actions_item()
+    actions = create_actions(plugin, abitem, state, {"a": "item:p.order", "b": "1"})
+    assert execute(actions, writes) == ["p.b", "p.a"]
+    assert execute(actions, writes) == ["p.b", "p.a"]
+    sh.return_item("p.order")(0)
+    assert execute(actions, writes) == ["p.a", "p.b"]
+
+
+# The cached order of actions is rebuilt when the additional actions are changed
+def test_action_plan_additional_actions():
+    sh, plugin, abitem, state, writes = create_actions_item()
+    actions = create_actions(plugin, abitem, state, {"a": "2"})
+    additional = create_actions(plugin, abitem, state, {"b": "1"})
+    assert execute(actions, writes, additional) == ["p.b", "p.a"]
+    additional.update("as_order_b", "3")
+    assert execute(actions, writes, additional) == ["p.a", "p.b"]
+    assert execute(actions, writes) == ["p.a"]
+
+
+# Run actions are run during the update in the order of the actions, even if the executor is active
+def test_run_action_synchronous():
+    sh, plugin, abitem, state, writes = create_actions_item()
+    sh.record = writes.append
+    actions = plugin.AutoBlindActions.AbActions(abitem)
+    actions.update("as_run_x", "sh.record('x')")
+    actions.update("as_order_x", "1")
+    actions.update("as_set_a", "1")
+    actions.update("as_order_a", "2")
+    actions.update("as_action_y", ["function: run", "eval: sh.record('y')", "order: 3"])
+    actions.complete(state)
+    plugin.AutoBlindExecutor.init(2, 10, 5)
+    try:
+        assert execute(actions, writes) == ["x", "p.a", "y"]
+    finally:
+        plugin.AutoBlindExecutor.stop()
+
+
+# Asynchronous run actions are run by the executor and do not block the update
+def test_run_action_asynchronous():
+    sh, plugin, abitem, state, writes = create_actions_item()
+    release = threading.Event()
+    done = threading.Event()
+    sh.block = lambda: (release.wait(2), done.set())
+    actions = plugin.AutoBlindActions.AbActions(abitem)
+    actions.update("as_async_x", "true")
+    actions.update("as_run_x", "sh.block()")
+    actions.update("as_action_y", ["function: run", "eval: sh.block()", "async: true"])
+    actions.complete(state)
+    plugin.AutoBlindExecutor.init(2, 10, 5)
+    try:
+        execute(actions, writes)
+        assert plugin.AutoBlindExecutor.executor.count() == 2
+        release.set()
+        assert done.wait(2)
+    finally:
+        plugin.AutoBlindExecutor.stop()
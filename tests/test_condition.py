@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# vim: set encoding=utf-8 tabstop=4 softtabstop=4 shiftwidth=4 expandtab
+#########################################################################
+#  Copyright 2014-     Thomas Ernst                       offline@gmx.net
+#########################################################################
+#  Finite state machine plugin for SmartHomeNG
+#
+#  This plugin is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This plugin is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this plugin. If not, see <http://www.gnu.org/licenses/>.
+#########################################################################
+import AutoBlindMock
+
+
+# Create an AbItem "c.o" with states "c.o.a" (num >= 70), "c.o.b" (num >= 30) and "c.o.c" and sensor items "c.num"
+# (type num, triggers an update) and "c.foo" (type foo)
+# returns: tuple (smarthome, plugin package, AbItem)
+def create_abitem():
+    plugin = AutoBlindMock.load_plugin()
+    sh = AutoBlindMock.create_smarthome()
+    sh.add_item("c")
+    sh.add_item("c.num", "num", 0)
+    sh.add_item("c.foo", "foo", None)
+    sh.add_item("c.laststate", "str", "")
+    conf = {
+        "as_plugin": "active",
+        "as_startup_delay": "-1",
+        "as_laststate_item_id": "c.laststate",
+        "as_item_num": "c.num",
+        "as_item_foo": "c.foo"
+    }
+    item = sh.add_item("c.o", "num", 0, conf)
+    sh.add_item("c.o.a", conf={"as_name": "a"})
+    sh.add_item("c.o.a.enter", conf={"as_min_num": "70"})
+    sh.add_item("c.o.b", conf={"as_name": "b"})
+    sh.add_item("c.o.b.enter", conf={"as_min_num": "30"})
+    sh.add_item("c.o.c", conf={"as_name": "c"})
+    sh.set_eval_trigger(item, ["c.num"])
+    abitem = plugin.AutoBlindItem.AbItem(sh, item)
+    abitem.startup()
+    return sh, plugin, abitem
+
+
+# Create and complete a condition
+# abitem: AbItem the condition belongs to
+# name: name of condition
+# settings: dict of settings (function -> value)
+# returns: AbCondition instance
+def create_condition(abitem, name, settings):
+    condition = AutoBlindMock.load_plugin().AutoBlindCondition.AbCondition(abitem, name)
+    for func, value in settings.items():
+        condition.set(func, value)
+    assert condition.complete(abitem.sh.return_item("c.o.c"))
+    return condition
+
+
+# Membership check of the baseline: elements of a different type are compared as strings
+# values: list of values
+# current: current value
+def baseline_contains(values, current):
+    for element in values:
+        if type(element) != type(current):
+            if str(element) == str(current):
+                return True
+        elif element == current:
+            return True
+    return False
+
+
+# Check a list condition against the baseline membership check for a number of current values
+# item_id: id of item to check
+# values: list of values of the condition
+# currents: current values to check
+def check_list_condition(item_id, values, currents):
+    sh, plugin, abitem = create_abitem()
+    item = sh.return_item(item_id)
+    cast_values = [item.cast(value) for value in values]
+    for negate in (False, True):
+        condition = create_condition(abitem, "sensor", {"as_item": item_id, "as_value": list(values),
+                                                        "as_negate": str(negate)})
+        for current in currents:
+            item.set(current, trigger=False)
+            assert condition.check() == (baseline_contains(cast_values, current) != negate), (negate, current)
+
+
+# Lists of a single type: values of other types are only matched by their string representation
+def test_list_single_type():
+    check_list_condition("c.num", ["1", "2", "30"], [1, 2, 3, 30, 1.0, 2.5, 0])
+    check_list_condition("c.foo", ["1", "2", "True"], ["1", 1, 2.0, True, "True", None, "x"])
+
+
+# Lists of mixed types, current values of all kinds including unhashable ones
+def test_list_mixed_types():
+    currents = [1, "1", 2, "2", 2.5, "2.5", True, "True", 1.0, None, "None", "x", [1], {"a": 1}, (1, 2)]
+    check_list_condition("c.foo", ["1", 2, 2.5, True, "x", None], currents)
+
+
+# Create and complete a condition set
+# abitem: AbItem the condition set belongs to
+# name: name of condition set (and of the item containing its settings)
+# conf: settings of condition set
+# compiled: check condition set by a generated function
+# returns: AbConditionSet instance
+def create_condition_set(abitem, name, conf, compiled):
+    sh = abitem.sh
+    item = sh.add_item("c.o.c." + name, conf={key: list(value) if isinstance(value, list) else value
+                                               for key, value in conf.items()})
+    condition_set = AutoBlindMock.load_plugin().AutoBlindConditionSet.AbConditionSet(abitem, name)
+    condition_set.update(item, sh.return_item("c.o"))
+    condition_set.complete(sh.return_item("c.o.c"))
+    if compiled:
+        condition_set.compile()
+    return condition_set
+
+
+# Settings of condition sets checked by a generated function and by the conditions themselves
+CONDITION_SETS = [
+    {"as_value_num": "50"},
+    {"as_value_num": "50", "as_negate_num": "True"},
+    {"as_min_num": "30"},
+    {"as_max_num": "70"},
+    {"as_min_num": "30", "as_max_num": "70"},
+    {"as_min_num": "30", "as_max_num": "70", "as_negate_num": "True"},
+    {"as_min_num": "30", "as_negate_num": "True"},
+    {"as_max_num": "70", "as_negate_num": "True"},
+    {"as_value_num": ["10", "50", "90"]},
+    {"as_value_num": ["10", "50", "90"], "as_negate_num": "True"},
+    {"as_value_foo": "50"},
+    {"as_value_foo": ["x", "50"], "as_negate_foo": "True"},
+    {"as_value_laststate": "c.o.a"},
+    {"as_value_laststate": ["c.o.a", "c.o.c"]},
+    {"as_value_laststate": "c.o.b", "as_negate_laststate": "True"},
+    {"as_value_laststate": "unknown"},
+    {"as_min_num": "30", "as_value_laststate": ["c.o.a", "c.o.b"], "as_value_foo": ["x", "50"]},
+    {"as_max_num": "90", "as_value_laststate": "c.o.b", "as_negate_laststate": "True", "as_value_foo": "x"},
+]
+
+
+# Generated functions of condition sets give the same results as the conditions themselves (value, min, max, negate,
+# lists and laststate), also after the order of the conditions has been changed
+def test_compiled_condition_sets():
+    sh, plugin, abitem = create_abitem()
+    pairs = [(create_condition_set(abitem, "i{0}".format(index), conf, False),
+              create_condition_set(abitem, "c{0}".format(index), conf, True))
+             for index, conf in enumerate(CONDITION_SETS)]
+    num = sh.return_item("c.num")
+    foo = sh.return_item("c.foo")
+    for __ in range(3):
+        for num_value in (0, 10, 29, 30, 31, 50, 50.0, 69, 70, 71, 90, 100):
+            # changes of num update the AbItem, so laststate changes, too
+            num(num_value)
+            for foo_value in (50, "50", 50.0, "x", None):
+                foo.set(foo_value, trigger=False)
+                for index, (interpreted, compiled) in enumerate(pairs):
+                    expected = interpreted.all_conditions_matching()
+                    assert compiled.all_conditions_matching() == expected, (CONDITION_SETS[index], num_value,
+                                                                             foo_value, sh.return_item("c.laststate")())
+
+
+# Check a condition set whose conditions reject alternately, so that the order of the conditions keeps changing
+# limit: maximum number of compiled orders
+# returns: number of generated functions
+def count_builds_alternating(monkeypatch, limit):
+    sh, plugin, abitem = create_abitem()
+    builds = []
+    build = plugin.AutoBlindCompiler.AbCodeGenerator.build
+    monkeypatch.setattr(plugin.AutoBlindCompiler.AbCodeGenerator, "build",
+                        lambda generator: builds.append(generator) or build(generator))
+    monkeypatch.setattr(plugin.AutoBlindConditionSet, "_compiled_orders_limit", limit)
+    conf = {"as_min_num": "30", "as_max_num": "70", "as_value_foo": ["x", "50"]}
+    condition_set = create_condition_set(abitem, "alternating", conf, True)
+    for phase in range(8):
+        sh.return_item("c.num").set(0 if phase % 2 == 0 else 50, trigger=False)
+        sh.return_item("c.foo").set("x" if phase % 2 == 0 else "y", trigger=False)
+        for __ in range(300):
+            assert not condition_set.all_conditions_matching()
+    return len(builds)
+
+
+# Functions are compiled once per order of the conditions, and not again when returning to an order
+def test_compiled_orders_reused(monkeypatch):
+    assert count_builds_alternating(monkeypatch, 8) == 2
+
+
+# When the limit of compiled orders is reached, the order is kept instead of compiling again
+def test_compiled_orders_limited(monkeypatch):
+    assert count_builds_alternating(monkeypatch, 1) == 1
+
+
+# Laststate conditions comparing positions of states give the same results as comparing the ids of the states,
+# including values that are no states of the item and an unknown last state
+def test_laststate_positions():
+    sh, plugin, abitem = create_abitem()
+    settings = [("c.o.a", False), ("c.o.b", True), (["c.o.a", "c.o.c"], False), (["c.o.a", "c.o.c"], True),
+                ("unknown", False), (["c.o.b", "unknown"], False), (["c.o.b", "unknown"], True)]
+    conditions = []
+    for value, negate in settings:
+        config = list(value) if isinstance(value, list) else value
+        condition = create_condition(abitem, "laststate", {"as_value": config, "as_negate": str(negate)})
+        conditions.append((condition, value if isinstance(value, list) else [value], negate))
+    laststates = set()
+    for num_value in (0, 50, 90, 10, 70):
+        for condition, values, negate in conditions:
+            laststate = abitem.get_laststate_id()
+            assert condition.check() == ((laststate in values) != negate), (values, negate, laststate)
+        laststates.add(abitem.get_laststate_id())
+        sh.return_item("c.num")(num_value)
+    assert laststates == {"", "c.o.a", "c.o.b", "c.o.c"}
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# vim: set encoding=utf-8 tabstop=4 softtabstop=4 shiftwidth=4 expandtab
+#########################################################################
+#  Copyright 2014-     Thomas Ernst                       offline@gmx.net
+#########################################################################
+#  Finite state machine plugin for SmartHomeNG
+#
+#  This plugin is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This plugin is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this plugin. If not, see <http://www.gnu.org/licenses/>.
+#########################################################################
+import datetime
+import math
+import time
+import zoneinfo
+import AutoBlindMock
+
+BERLIN = zoneinfo.ZoneInfo("Europe/Berlin")
+UTC = datetime.timezone.utc
+
+
+# Create mock SmartHomeNG with the simulated clock at the given point in time
+# start: start time (timezone aware datetime)
+def create_smarthome(start):
+    return AutoBlindMock.create_smarthome(AutoBlindMock.MockClock(start))
+
+
+# Return sun position (degrees) at a point in time determined directly from the sun model
+# smarthome: mock SmartHomeNG
+# dt: point in time (timezone aware datetime)
+def get_sun_pos(smarthome, dt):
+    azimut, altitude = smarthome.sun.pos((dt.astimezone(UTC) - smarthome.now().astimezone(UTC)).total_seconds() / 60)
+    return math.degrees(azimut), math.degrees(altitude)
+
+
+# Check table positions and crossings against the sun model for a day with a DST change
+# day: day with DST change (date)
+def check_sun_table_day(day):
+    plugin = AutoBlindMock.load_plugin()
+    sh = create_smarthome(datetime.datetime(day.year, day.month, day.day, 0, 30, tzinfo=BERLIN))
+    table = plugin.AutoBlindCurrent.AbSunTable(sh)
+    for hour in (1, 4, 12, 20, 23):
+        dt = datetime.datetime(day.year, day.month, day.day, hour, 0, tzinfo=BERLIN)
+        azimut, altitude = table.get_pos(dt)
+        expected_azimut, expected_altitude = get_sun_pos(sh, dt)
+        assert abs(azimut - expected_azimut) < 0.01, hour
+        assert abs(altitude - expected_altitude) < 0.01, hour
+
+    crossing = table.get_next_crossing(sh.now(), [], [0])
+    assert sh.now() < crossing < sh.now() + datetime.timedelta(days=1)
+    assert abs(get_sun_pos(sh, crossing)[1]) < 0.01
+
+
+# Sun positions from the table are correct after the switch to daylight saving time
+def test_sun_table_dst_start():
+    check_sun_table_day(datetime.date(2026, 3, 29))
+
+
+# Sun positions from the table are correct after the switch back to standard time
+def test_sun_table_dst_end():
+    check_sun_table_day(datetime.date(2026, 10, 25))
+
+
+# Crossings determined without table are correct on days with DST change
+def test_sun_crossing_without_table_dst():
+    plugin = AutoBlindMock.load_plugin()
+    sh = create_smarthome(datetime.datetime(2026, 3, 29, 0, 30, tzinfo=BERLIN))
+    current = plugin.AutoBlindCurrent.AbCurrent(sh, 30, False)
+    crossing = current.get_next_sun_crossing([], [0])
+    assert abs(get_sun_pos(sh, crossing)[1]) < 0.5
+
+
+# Lookups in the sun table are counted separately from the cache of sun positions
+def test_sun_statistics():
+    plugin = AutoBlindMock.load_plugin()
+    sh = create_smarthome(datetime.datetime(2026, 6, 1, 12, 0, tzinfo=BERLIN))
+    with_table = plugin.AutoBlindCurrent.AbCurrent(sh, 30, True)
+    without_table = plugin.AutoBlindCurrent.AbCurrent(sh, 30, False)
+    for current in (with_table, without_table):
+        current.get_sun_azimut()
+        current.get_sun_altitude()
+    assert with_table.get_statistics()["sun"] == (0, 0)
+    assert with_table.get_statistics()["sun_table"] == (2, 1)
+    assert without_table.get_statistics()["sun"] == (1, 1)
+    assert without_table.get_statistics()["sun_table"] == (0, 0)
+
+
+# The next table is built in the background when half of the first day has passed, so lookups on the next day do not
+# wait for a build
+def test_sun_table_built_ahead():
+    plugin = AutoBlindMock.load_plugin()
+    sh = create_smarthome(datetime.datetime(2026, 6, 1, 0, 30, tzinfo=UTC))
+    table = plugin.AutoBlindCurrent.AbSunTable(sh)
+    table.get_pos(sh.now())
+    assert table.get_build_count() == 1
+
+    table.get_pos(sh.now() + datetime.timedelta(hours=13))
+    for __ in range(200):
+        if table.get_build_count() == 2:
+            break
+        time.sleep(0.01)
+    assert table.get_build_count() == 2
+
+    dt = sh.now() + datetime.timedelta(hours=24, minutes=15)
+    azimut, altitude = table.get_pos(dt)
+    expected_azimut, expected_altitude = get_sun_pos(sh, dt)
+    assert abs(azimut - expected_azimut) < 0.01
+    assert abs(altitude - expected_altitude) < 0.01
+    crossing = table.get_next_crossing(dt, [], [0])
+    assert dt < crossing < dt + datetime.timedelta(days=1)
+    assert abs(get_sun_pos(sh, crossing)[1]) < 0.01
+    assert table.get_build_count() == 2
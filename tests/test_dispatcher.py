@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# vim: set encoding=utf-8 tabstop=4 softtabstop=4 shiftwidth=4 expandtab
+#########################################################################
+#  Copyright 2014-     Thomas Ernst                       offline@gmx.net
+#########################################################################
+#  Finite state machine plugin for SmartHomeNG
+#
+#  This plugin is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This plugin is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this plugin. If not, see <http://www.gnu.org/licenses/>.
+#########################################################################
+import threading
+import time
+import AutoBlindMock
+
+
+# Create an AutoBlind item "t.o" with state "t.o.hi" (sensor >= 50) and fallback state "t.o.lo"
+# returns: tuple (smarthome, plugin package, AbItem, sensor item, other item, laststate item)
+def create_item():
+    plugin = AutoBlindMock.load_plugin()
+    sh = AutoBlindMock.create_smarthome()
+    sh.add_item("t")
+    sensor = sh.add_item("t.sensor", "num", 0)
+    other = sh.add_item("t.other", "num", 0)
+    laststate = sh.add_item("t.laststate", "str", "")
+    conf = {
+        "as_plugin": "active",
+        "as_startup_delay": "-1",
+        "as_laststate_item_id": "t.laststate",
+        "as_item_sensor": "t.sensor"
+    }
+    item = sh.add_item("t.o", "num", 0, conf)
+    sh.add_item("t.o.hi", conf={"as_name": "high"})
+    sh.add_item("t.o.hi.enter", conf={"as_min_sensor": "50"})
+    sh.add_item("t.o.lo", conf={"as_name": "low"})
+    sh.set_eval_trigger(item, ["t.sensor", "t.other"])
+    abitem = plugin.AutoBlindItem.AbItem(sh, item)
+    abitem.startup()
+    return sh, plugin, abitem, sensor, other, laststate
+
+
+# A change caused by the plugin as last trigger of a batch must not hide an earlier sensor change
+def test_batch_own_change_last():
+    sh, plugin, abitem, sensor, other, laststate = create_item()
+    plugin.AutoBlindDispatcher.init(0.05, 1)
+    try:
+        sensor.set(80, "KNX")
+        other.set(5, plugin.AutoBlindDefaults.plugin_identification)
+        time.sleep(0.3)
+    finally:
+        plugin.AutoBlindDispatcher.stop()
+    assert laststate() == "t.o.hi"
+
+
+# A batch consisting of changes caused by the plugin only does not change the state
+def test_batch_own_changes_only():
+    sh, plugin, abitem, sensor, other, laststate = create_item()
+    plugin.AutoBlindDispatcher.init(0.05, 1)
+    try:
+        sensor.set(80, plugin.AutoBlindDefaults.plugin_identification)
+        other.set(5, plugin.AutoBlindDefaults.plugin_identification)
+        time.sleep(0.3)
+    finally:
+        plugin.AutoBlindDispatcher.stop()
+    assert laststate() == ""
+
+
+# A batch started while the previous batch is still running waits for it. The current conditions stay held until the
+# running batch is complete
+def test_batches_serialized():
+    sh, plugin, abitem, sensor, other, laststate = create_item()
+    started = threading.Event()
+    release = threading.Event()
+    events = []
+    update_state = abitem.update_state
+
+    # update of the AbItem: block the first update and record if the current conditions are held
+    def blocking_update(*args):
+        events.append("start")
+        if not started.is_set():
+            started.set()
+            release.wait(2)
+        update_state(*args)
+        events.append(plugin.AutoBlindCurrent._hold)
+
+    abitem.update_state = blocking_update
+    plugin.AutoBlindDispatcher.init(0.05, 1)
+    try:
+        sensor.set(80, "KNX")
+        assert started.wait(2)
+        other.set(5, "KNX")
+        time.sleep(0.3)
+        assert events == ["start"]
+        release.set()
+        time.sleep(0.3)
+    finally:
+        plugin.AutoBlindDispatcher.stop()
+    assert events == ["start", True, "start", True]
+    assert not plugin.AutoBlindCurrent._hold
+    assert laststate() == "t.o.hi"
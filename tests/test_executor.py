@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# vim: set encoding=utf-8 tabstop=4 softtabstop=4 shiftwidth=4 expandtab
+#########################################################################
+#  Copyright 2014-     Thomas Ernst                       offline@gmx.net
+#########################################################################
+#  Finite state machine plugin for SmartHomeNG
+#
+#  This plugin is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This plugin is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this plugin. If not, see <http://www.gnu.org/licenses/>.
+#########################################################################
+import logging
+import threading
+import time
+import AutoBlindMock
+
+
+# Minimal stand-in for a run context: id and logger are all the executor uses
+class Context:
+    def __init__(self, abitem_id):
+        self.id = abitem_id
+        self.logger = AutoBlindMock.load_plugin().AutoBlindLogger.AbLoggerDummy()
+
+
+# A job running longer than the timeout is reported while it is still running, even if no further job is submitted
+def test_hanging_job_reported(caplog):
+    plugin = AutoBlindMock.load_plugin()
+    executor = plugin.AutoBlindExecutor.AbRunExecutor(1, 10, 0.1)
+    finished = threading.Event()
+    try:
+        with caplog.at_level(logging.WARNING):
+            executor.submit(Context("a"), "Action 'hang'", finished.wait, 2)
+            time.sleep(0.4)
+            assert any("Still running" in record.getMessage() for record in caplog.records)
+    finally:
+        finished.set()
+        executor.stop()
+
+
+# Jobs not started yet are discarded when the executor is stopped
+def test_stop_discards_waiting_jobs():
+    plugin = AutoBlindMock.load_plugin()
+    executor = plugin.AutoBlindExecutor.AbRunExecutor(1, 10, 5)
+    started = threading.Event()
+    release = threading.Event()
+    executed = []
+    executor.submit(Context("a"), "first", lambda: (started.set(), release.wait(2)))
+    executor.submit(Context("a"), "second", executed.append, "a")
+    executor.submit(Context("b"), "third", executed.append, "b")
+    assert started.wait(2)
+    executor.stop()
+    release.set()
+    time.sleep(0.2)
+    assert executed == []
+
+
+# A run context keeps the variables of the AbItem as they were when it was created
+def test_run_context_variables():
+    plugin = AutoBlindMock.load_plugin()
+    sh = AutoBlindMock.create_smarthome()
+    sh.add_item("r")
+    item = sh.add_item("r.o", "num", 0, {"as_plugin": "active", "as_startup_delay": "-1"})
+    sh.add_item("r.o.state", conf={"as_name": "state"})
+    abitem = plugin.AutoBlindItem.AbItem(sh, item)
+    abitem.startup()
+    abitem.set_variable("item.suspend_time", 10)
+    context = abitem.get_run_context()
+    abitem.set_variable("item.suspend_time", 20)
+    context.set_variable("item.suspend_remaining", 5)
+    assert context.get_variable("item.suspend_time") == 10
+    assert abitem.get_variable("item.suspend_remaining") != 5
+    assert context.id == abitem.id
+    assert context.return_item("r.o") is item
+
+
+# Hanging jobs of several items are reported once each by the monitor
+def test_hanging_jobs_reported_once(caplog):
+    plugin = AutoBlindMock.load_plugin()
+    executor = plugin.AutoBlindExecutor.AbRunExecutor(2, 10, 0.1)
+    finished = threading.Event()
+    try:
+        with caplog.at_level(logging.WARNING):
+            executor.submit(Context("a"), "Action 'a'", finished.wait, 2)
+            executor.submit(Context("b"), "Action 'b'", finished.wait, 2)
+            time.sleep(0.5)
+            reports = [record.getMessage() for record in caplog.records if "Still running" in record.getMessage()]
+            assert sorted(reports) == ["Action 'a': Still running after 0.1 seconds",
+                                       "Action 'b': Still running after 0.1 seconds"]
+    finally:
+        finished.set()
+        executor.stop()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# vim: set encoding=utf-8 tabstop=4 softtabstop=4 shiftwidth=4 expandtab
+#########################################################################
+#  Copyright 2014-     Thomas Ernst                       offline@gmx.net
+#########################################################################
+#  Finite state machine plugin for SmartHomeNG
+#
+#  This plugin is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This plugin is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this plugin. If not, see <http://www.gnu.org/licenses/>.
+#########################################################################
+import threading
+import pytest
+import AutoBlindMock
+
+
+# Create an AutoBlind item "t.o" with state "t.o.hi" (sensor >= 50) and fallback state "t.o.lo". The item is updated
+# when "t.sensor" or "t.other" change
+# enter: additional conditions for entering "t.o.hi"
+# conf: additional attributes of "t.o"
+# startup: start the AbItem
+# returns: tuple (smarthome, plugin package, AbItem, sensor item, other item, laststate item)
+def create_item(enter=None, conf=None, startup=True):
+    plugin = AutoBlindMock.load_plugin()
+    sh = AutoBlindMock.create_smarthome()
+    sh.add_item("t")
+    sensor = sh.add_item("t.sensor", "num", 0)
+    other = sh.add_item("t.other", "num", 0)
+    laststate = sh.add_item("t.laststate", "str", "")
+    conf = {
+        "as_plugin": "active",
+        "as_startup_delay": "-1",
+        "as_laststate_item_id": "t.laststate",
+        "as_item_sensor": "t.sensor",
+        **(conf or {})
+    }
+    item = sh.add_item("t.o", "num", 0, conf)
+    sh.add_item("t.o.hi", conf={"as_name": "high"})
+    sh.add_item("t.o.hi.enter", conf={"as_min_sensor": "50", **(enter or {})})
+    sh.add_item("t.o.lo", conf={"as_name": "low"})
+    sh.set_eval_trigger(item, ["t.sensor", "t.other"])
+    abitem = plugin.AutoBlindItem.AbItem(sh, item)
+    if startup:
+        abitem.startup()
+    return sh, plugin, abitem, sensor, other, laststate
+
+
+# Cached results of condition sets are kept on triggers of other items, dropped when an item they depend on triggers
+# and dropped completely on triggers not caused by an item (cycle, cron, ...)
+def test_dependency_index_invalidation():
+    sh, plugin, abitem, sensor, other, laststate = create_item()
+    sensor(80)
+    assert laststate() == "t.o.hi"
+
+    # change without trigger: the cached result of "t.o.hi" is still used
+    sensor.set(10, trigger=False)
+    other(1)
+    assert laststate() == "t.o.hi"
+
+    # trigger by the item the condition set depends on
+    sensor(20)
+    assert laststate() == "t.o.lo"
+
+    sensor.set(90, trigger=False)
+    other(2)
+    assert laststate() == "t.o.lo"
+
+    # trigger by something else than an item
+    sh.return_item("t.o")(1, caller="Scheduler")
+    assert laststate() == "t.o.hi"
+
+
+# Items are read directly again after an update failed while checking the states
+def test_snapshot_ended_on_error():
+    sh, plugin, abitem, sensor, other, laststate = create_item({"as_value_probe": "1"}, {"as_eval_probe": "sh.probe()"})
+    sh.probe = lambda: 1 / 0
+    with pytest.raises(ValueError):
+        sensor(80)
+    sensor.set(30, trigger=False)
+    assert abitem.get_item_value(sensor) == 30
+
+
+# An item with sun limits the sun does not reach within a day is checked again after a day instead of never again
+def test_wakeup_without_sun_crossing():
+    plugin = AutoBlindMock.load_plugin()
+    sh = AutoBlindMock.create_smarthome()
+    sh.add_item("w")
+    item = sh.add_item("w.o", "num", 0, {"as_plugin": "active", "as_startup_delay": "-1"})
+    sh.add_item("w.o.high", conf={"as_name": "high"})
+    # the sun of the mock reaches an altitude of 60 degrees at most
+    sh.add_item("w.o.high.enter", conf={"as_min_sun_altitude": "80"})
+    sh.add_item("w.o.low", conf={"as_name": "low"})
+    plugin.AutoBlindItem.AbItem(sh, item).startup()
+
+    for __ in range(2):
+        wakeup = sh.scheduler.return_next("w.o-Wakeup")
+        assert wakeup is not None
+        assert abs((wakeup - sh.now()).total_seconds() - 86400) < 5
+        sh.advance((wakeup - sh.now()).total_seconds())
+
+
+# Initializing an AbItem does not run an update (items are initialized in parallel), the first update is run on startup
+def test_first_update_on_startup():
+    sh, plugin, abitem, sensor, other, laststate = create_item(conf={"as_startup_delay": "0"}, startup=False)
+    assert laststate() == ""
+    sensor.set(80, trigger=False)
+    abitem.startup()
+    assert laststate() == "t.o.hi"
+
+
+# Triggers received while an update is running are coalesced into one follow-up update for the last trigger. Changes
+# caused by the plugin do not replace a waiting trigger
+def test_update_coalescing():
+    sh, plugin, abitem, sensor, other, laststate = create_item({"as_value_probe": "1"}, {"as_eval_probe": "sh.probe()"})
+    sensor.set(80, trigger=False)
+    started = threading.Event()
+    release = threading.Event()
+    callers = []
+
+    # eval of the condition "probe": remember the caller of each update and block the first update
+    def probe():
+        callers.append(abitem.get_update_trigger_caller())
+        if len(callers) == 1:
+            started.set()
+            release.wait(2)
+        return 1
+
+    sh.probe = probe
+    item = sh.return_item("t.o")
+    thread = threading.Thread(target=abitem.update_state, args=(item, "Logic"))
+    thread.start()
+    assert started.wait(2)
+    abitem.update_state(item, "Scheduler")
+    abitem.update_state(item, "Timer")
+    abitem.update_state(item, plugin.AutoBlindDefaults.plugin_identification)
+    release.set()
+    thread.join(2)
+    assert callers == ["Logic", "Timer"]
+    assert laststate() == "t.o.hi"
+
+    # the next update runs immediately again
+    abitem.update_state(item, "Cycle")
+    assert callers == ["Logic", "Timer", "Cycle"]
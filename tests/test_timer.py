@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# vim: set encoding=utf-8 tabstop=4 softtabstop=4 shiftwidth=4 expandtab
+#########################################################################
+#  Copyright 2014-     Thomas Ernst                       offline@gmx.net
+#########################################################################
+#  Finite state machine plugin for SmartHomeNG
+#
+#  This plugin is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This plugin is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this plugin. If not, see <http://www.gnu.org/licenses/>.
+#########################################################################
+import AutoBlindMock
+
+
+# Initialize the timing wheel on a mock SmartHomeNG
+# returns: tuple (smarthome, plugin package, list of timers called, callback recording the name of a timer)
+def create_wheel():
+    plugin = AutoBlindMock.load_plugin()
+    sh = AutoBlindMock.create_smarthome()
+    plugin.AutoBlindTimer.init(sh)
+    calls = []
+    return sh, plugin, calls, lambda name: calls.append(name)
+
+
+# A timer is called with its arguments when it is due, not earlier
+def test_timer_fires():
+    sh, plugin, calls, record = create_wheel()
+    try:
+        plugin.AutoBlindTimer.add(("a", "x"), 5, record, {"name": "x"})
+        for __ in range(4):
+            sh.advance(1)
+        assert calls == []
+        assert plugin.AutoBlindTimer.wheel.count() == 1
+        sh.advance(1)
+        assert calls == ["x"]
+        assert plugin.AutoBlindTimer.wheel.count() == 0
+        sh.advance(10)
+        assert calls == ["x"]
+    finally:
+        plugin.AutoBlindTimer.stop()
+
+
+# Adding a timer with the key of a pending timer replaces the pending timer
+def test_timer_replace():
+    sh, plugin, calls, record = create_wheel()
+    try:
+        plugin.AutoBlindTimer.add(("a", "x"), 2, record, {"name": "first"})
+        plugin.AutoBlindTimer.add(("a", "x"), 4, record, {"name": "second"})
+        plugin.AutoBlindTimer.add(("b", "x"), 3, record, {"name": "other"})
+        assert [key for due, key in plugin.AutoBlindTimer.wheel.get_pending()] == [("b", "x"), ("a", "x")]
+        for __ in range(5):
+            sh.advance(1)
+        assert calls == ["other", "second"]
+    finally:
+        plugin.AutoBlindTimer.stop()
+
+
+# A removed timer is not called
+def test_timer_remove():
+    sh, plugin, calls, record = create_wheel()
+    try:
+        plugin.AutoBlindTimer.add(("a", "x"), 2, record, {"name": "x"})
+        assert plugin.AutoBlindTimer.remove(("a", "x"))
+        assert not plugin.AutoBlindTimer.remove(("a", "x"))
+        sh.advance(1)
+        sh.advance(1)
+        assert calls == []
+    finally:
+        plugin.AutoBlindTimer.stop()
+
+
+# Timers further ahead than one round of the wheel are called when they are due
+def test_timer_beyond_wheel():
+    sh, plugin, calls, record = create_wheel()
+    try:
+        plugin.AutoBlindTimer.add(("a", "x"), 3605, record, {"name": "x"})
+        sh.advance(3600)
+        assert calls == []
+        for __ in range(5):
+            sh.advance(1)
+        assert calls == ["x"]
+    finally:
+        plugin.AutoBlindTimer.stop()
+
+
+# Without an initialized timing wheel timers are ignored instead of failing
+def test_timer_not_initialized():
+    plugin = AutoBlindMock.load_plugin()
+    plugin.AutoBlindTimer.stop()
+    plugin.AutoBlindTimer.add(("a", "x"), 1, print)
+    assert not plugin.AutoBlindTimer.remove(("a", "x"))
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+# vim: set encoding=utf-8 tabstop=4 softtabstop=4 shiftwidth=4 expandtab
+#########################################################################
+#  Copyright 2014-     Thomas Ernst                       offline@gmx.net
+#########################################################################
+#  Finite state machine plugin for SmartHomeNG
+#
+#  This plugin is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This plugin is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this plugin. If not, see <http://www.gnu.org/licenses/>.
+#########################################################################
+import AutoBlindMock
+
+
+# Create a chain of items using each other via "as_use": a.p<n>.c uses a.p<n+1>.c, a.p<n> has attribute as_x<n>
+# count: number of items in chain
+# returns: mock SmartHomeNG
+def create_use_chain(count):
+    sh = AutoBlindMock.create_smarthome()
+    sh.add_item("a")
+    for number in range(count):
+        sh.add_item("a.p{0}".format(number), conf={"as_x{0}".format(number): str(number)})
+        conf = {"as_use": "a.p{0}.c".format(number + 1)} if number < count - 1 else {}
+        sh.add_item("a.p{0}.c".format(number), conf=conf)
+    return sh
+
+
+# A lookup of an item inside a truncated "as_use"-chain returns the full view of the item, not the truncated one
+def test_get_attributes_truncated_chain():
+    tools = AutoBlindMock.load_plugin().AutoBlindTools
+    sh = create_use_chain(9)
+    try:
+        outer = tools.get_attributes(sh, sh.return_item("a.p0.c"))
+        assert "as_x6" in outer and "as_x7" not in outer
+        inner = tools.get_attributes(sh, sh.return_item("a.p2.c"))
+        assert "as_x8" in inner and "as_x2" in inner
+        assert tools.find_attribute(sh, sh.return_item("a.p2.c"), "as_x8") == "8"
+    finally:
+        tools.clear_attribute_index()